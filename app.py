@@ -1,23 +1,59 @@
 # Imports
 
 import sys
-import json
+import click
+import hashlib
+import queue
+import threading
 import logging
 from logging import Formatter, FileHandler
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from flask import (Flask, abort, 
                    render_template, 
                    request, Response, 
-                   flash, redirect, url_for)
+                   flash, redirect, url_for,
+                   jsonify, stream_with_context)
 from flask_moment import Moment
 from flask_wtf import Form
 from flask_migrate import Migrate
-
-from models import db, Venue, Artist, Show
-from forms import ShowForm, VenueForm, ArtistForm 
-from utils import format_datetime
-from config import SQLALCHEMY_DATABASE_URI, SECRET_KEY, WTF_CSRF_SECRET_KEY
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm.exc import StaleDataError
+
+from models import db, Venue, Artist, Show, VenueDeletion
+from forms import ShowForm, BulkShowForm, VenueForm, ArtistForm 
+from utils import format_datetime, ics_escape, ics_datetime, ics_line
+from partitions import maintain_partitions
+from scheduling import lock_bookings, find_conflict, schedule_shows
+from cleanup import delete_venue_now, schedule_venue_purge
+from editing import (EditConflict, apply_edit, edited, overlaps, snapshot, parse_snapshot,
+                     VENUE_EDITS, ARTIST_EDITS, FORM_FIELDS)
+from jobs import Worker, enqueue
+import tasks  # registers the job functions
+from events import Broadcaster, coalesce, notify, parse_filters, format_event, RETRY, KEEPALIVE
+from summaries import refresh_summaries
+from caches import SearchCache, NameCache
+from guards import StatementTimeouts, Limiter, is_statement_timeout, statement_timeouts_hit
+from warmup import Warmup
+import metrics
+import readers
+from config import (SQLALCHEMY_DATABASE_URI, SECRET_KEY, WTF_CSRF_SECRET_KEY,
+                    SHOW_PARTITIONS_AHEAD, SHOW_PARTITIONS_RETAIN,
+                    PAST_SHOWS_WINDOW_DAYS, CALENDAR_MAX_DAYS,
+                    CALENDAR_CACHE_SECONDS, DEFAULT_SHOW_MINUTES,
+                    MAX_SHOW_MINUTES, BULK_SHOWS_MAX_ROWS,
+                    VENUE_DELETE_INLINE_SHOWS, VENUE_PURGE_CHUNK,
+                    WORKER_CONCURRENCY, WORKER_POLL_SECONDS, JOB_LEASE_SECONDS,
+                    JOB_BACKOFF_SECONDS, JOB_BACKOFF_MAX_SECONDS,
+                    PARTITION_MAINTENANCE_SECONDS, GENRE_COUNTS_REFRESH_SECONDS,
+                    JOB_PRUNE_SECONDS, JOB_RETAIN_DONE_DAYS, JOB_RETAIN_FAILED_DAYS,
+                    SUMMARY_MAX_AGE_SECONDS, SUMMARY_REFRESH_SECONDS,
+                    SSE_BUFFER_SIZE, SSE_KEEPALIVE_SECONDS, SSE_MAX_STREAMS,
+                    LISTENER_START_SECONDS,
+                    SEARCH_CACHE_BYTES, SEARCH_CACHE_SECONDS,
+                    STATEMENT_TIMEOUTS, SEARCH_MAX_RESULTS, ADMISSION_LIMITS,
+                    ADMISSION_RETRY_AFTER, WARMUP_TOP, WARMUP_ON_START,
+                    WARMUP_RETRY_SECONDS, WARMUP_RETRY_MAX_SECONDS)
 
 # App Config.
 app = Flask(__name__)
@@ -26,111 +62,242 @@ app.config["SQLALCHEMY_DATABASE_URI"] = SQLALCHEMY_DATABASE_URI
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["SECRET_KEY"] = SECRET_KEY
 app.config["WTF_CSRF_SECRET_KEY"] = WTF_CSRF_SECRET_KEY
+app.config["SHOW_PARTITIONS_AHEAD"] = SHOW_PARTITIONS_AHEAD
+app.config["SHOW_PARTITIONS_RETAIN"] = SHOW_PARTITIONS_RETAIN
+app.config["PAST_SHOWS_WINDOW_DAYS"] = PAST_SHOWS_WINDOW_DAYS
+app.config["CALENDAR_MAX_DAYS"] = CALENDAR_MAX_DAYS
+app.config["CALENDAR_CACHE_SECONDS"] = CALENDAR_CACHE_SECONDS
+app.config["DEFAULT_SHOW_MINUTES"] = DEFAULT_SHOW_MINUTES
+app.config["MAX_SHOW_MINUTES"] = MAX_SHOW_MINUTES
+app.config["BULK_SHOWS_MAX_ROWS"] = BULK_SHOWS_MAX_ROWS
+app.config["VENUE_DELETE_INLINE_SHOWS"] = VENUE_DELETE_INLINE_SHOWS
+app.config["VENUE_PURGE_CHUNK"] = VENUE_PURGE_CHUNK
+app.config["WORKER_CONCURRENCY"] = WORKER_CONCURRENCY
+app.config["WORKER_POLL_SECONDS"] = WORKER_POLL_SECONDS
+app.config["JOB_LEASE_SECONDS"] = JOB_LEASE_SECONDS
+app.config["JOB_BACKOFF_SECONDS"] = JOB_BACKOFF_SECONDS
+app.config["JOB_BACKOFF_MAX_SECONDS"] = JOB_BACKOFF_MAX_SECONDS
+app.config["PARTITION_MAINTENANCE_SECONDS"] = PARTITION_MAINTENANCE_SECONDS
+app.config["GENRE_COUNTS_REFRESH_SECONDS"] = GENRE_COUNTS_REFRESH_SECONDS
+app.config["JOB_PRUNE_SECONDS"] = JOB_PRUNE_SECONDS
+app.config["JOB_RETAIN_DONE_DAYS"] = JOB_RETAIN_DONE_DAYS
+app.config["JOB_RETAIN_FAILED_DAYS"] = JOB_RETAIN_FAILED_DAYS
+app.config["SUMMARY_MAX_AGE_SECONDS"] = SUMMARY_MAX_AGE_SECONDS
+app.config["SUMMARY_REFRESH_SECONDS"] = SUMMARY_REFRESH_SECONDS
+app.config["SSE_BUFFER_SIZE"] = SSE_BUFFER_SIZE
+app.config["SSE_KEEPALIVE_SECONDS"] = SSE_KEEPALIVE_SECONDS
+app.config["SSE_MAX_STREAMS"] = SSE_MAX_STREAMS
+app.config["LISTENER_START_SECONDS"] = LISTENER_START_SECONDS
+app.config["SEARCH_CACHE_BYTES"] = SEARCH_CACHE_BYTES
+app.config["SEARCH_CACHE_SECONDS"] = SEARCH_CACHE_SECONDS
+app.config["STATEMENT_TIMEOUTS"] = STATEMENT_TIMEOUTS
+app.config["SEARCH_MAX_RESULTS"] = SEARCH_MAX_RESULTS
+app.config["ADMISSION_LIMITS"] = ADMISSION_LIMITS
+app.config["ADMISSION_RETRY_AFTER"] = ADMISSION_RETRY_AFTER
+app.config["WARMUP_TOP"] = WARMUP_TOP
+app.config["WARMUP_ON_START"] = WARMUP_ON_START
+app.config["WARMUP_RETRY_SECONDS"] = WARMUP_RETRY_SECONDS
+app.config["WARMUP_RETRY_MAX_SECONDS"] = WARMUP_RETRY_MAX_SECONDS
 db.app = app
 migrate = Migrate(app, db)
 db.init_app(app)
 app.jinja_env.filters['datetime'] = format_datetime
+broadcaster = Broadcaster(app.config["SSE_BUFFER_SIZE"])
+search_cache = SearchCache(app.config["SEARCH_CACHE_BYTES"],
+                           app.config["SEARCH_CACHE_SECONDS"],
+                           live=broadcaster.listening.is_set)
+name_cache = NameCache()
+statement_timeouts = StatementTimeouts(app.config["STATEMENT_TIMEOUTS"])
+search_limiter = Limiter('search', app.config["ADMISSION_LIMITS"]["search"],
+                         app.config["ADMISSION_RETRY_AFTER"])
+calendar_limiter = Limiter('calendar', app.config["ADMISSION_LIMITS"]["calendar"],
+                           app.config["ADMISSION_RETRY_AFTER"])
+metrics.Gauge('fyyur_search_max_results', 'Matches listed per search.',
+              callback=lambda: {(): app.config["SEARCH_MAX_RESULTS"]})
+
+
+def forget_changes(message):
+  # writes in other processes reach this one as events after their commit
+  search_cache.invalidate()
+  data = message["data"]
+  if message["event"] in ('venue_updated', 'venue_deleted'):
+    name_cache.invalidate('venue', data["venue_id"])
+  elif message["event"] == 'artist_updated':
+    name_cache.invalidate('artist', data["artist_id"])
+
+def forget_everything():
+  # the listener (re)connected and may have missed events
+  search_cache.invalidate()
+  name_cache.clear()
+
+broadcaster.add_handler(forget_changes)
+broadcaster.add_reset_handler(forget_everything)
+
+warm_up = Warmup(app, name_cache, app.config["WARMUP_TOP"],
+                 app.config["WARMUP_RETRY_SECONDS"],
+                 app.config["WARMUP_RETRY_MAX_SECONDS"])
+booted = threading.Lock()
+
+def boot():
+  # once per serving process, after any fork (see gunicorn.conf.py):
+  # the caches are only used once the listener keeps them current,
+  # then the warm-up runs in the background while /healthz/ready
+  # keeps the process out of rotation
+  if not booted.acquire(blocking=False):
+    return
+  broadcaster.start(db.engine)
+  broadcaster.listening.wait(app.config["LISTENER_START_SECONDS"])
+  if app.config["WARMUP_ON_START"]:
+    warm_up.start()
+  else:
+    with app.app_context():
+      readers.run(readers.warm_names(name_cache))
+
+@app.before_first_request
+def boot_unless_booted():
+  # 'flask run' and 'python app.py' have no boot hook
+  boot()
+
+
+def read(loader):
+  # runs a read page under the endpoint's statement_timeout
+  return readers.run(loader, statement_timeouts.get(request.endpoint))
+
+
+def past_shows_cutoff():
+  # oldest start_time listed on pages, bounding start_time
+  # lets Postgres prune every older Show partition
+  return datetime.now() - timedelta(days=app.config["PAST_SHOWS_WINDOW_DAYS"])
+
+
+#  Summaries
+
+def request_summary_refresh():
+  # debounced by the job key, commits with the caller
+  enqueue('refresh_summaries', key='refresh_summaries')
+
+
+#  Calendars
+
+def calendar_window():
+  try:
+    return readers.calendar_window(request.args, app.config["CALENDAR_MAX_DAYS"])
+  except ValueError:
+    abort(400)
+
+def render_calendar(kind, entity_id):
+  # shows of a venue or artist within ?from=&to=, HTML or ?format=json
+  start, end = calendar_window()
+  page = read(readers.calendar_page(kind, entity_id, start, end))
+  if page is None:
+    abort(404)
+  entity = page["entity"]
+  if request.args.get('format') == 'json':
+    return jsonify({
+      "id": entity.id,
+      "name": entity.name,
+      "from": start.isoformat(),
+      "to": end.isoformat(),
+      "shows": page["shows"],
+    })
+  span = end - start
+  endpoint_args = {kind + '_id': entity.id}
+  return render_template('pages/calendar.html', kind=kind,
+                         prev_url=url_for(request.endpoint, **endpoint_args,
+                                          **{'from': (start - span).isoformat(),
+                                             'to': start.isoformat()}),
+                         next_url=url_for(request.endpoint, **endpoint_args,
+                                          **{'from': end.isoformat(),
+                                             'to': (end + span).isoformat()}),
+                         ics_url=url_for(request.endpoint + '_ics', **endpoint_args,
+                                         **{'from': start.isoformat(),
+                                            'to': end.isoformat()}),
+                         **page)
+
+def calendar_feed(kind, entity_id):
+  # iCalendar feed for one window, streamed row by row and
+  # tagged so clients can revalidate without a download
+  start, end = calendar_window()
+  entity = read(readers.calendar_entity(kind, entity_id))
+  if entity is None:
+    abort(404)
+  # the feed's own statements, streaming included, get the timeout too
+  db.session.execute(readers.statement_timeout(statement_timeouts.get(request.endpoint)))
+  count, last_id, versions = db.session.execute(
+    readers.calendar_tag(kind, entity.id, start, end)).one()
+  etag = hashlib.md5(('%s:%d:%s:%s:%d:%s:%s:%s' % (
+    kind, entity.id, start.isoformat(), end.isoformat(),
+    count, last_id, versions, entity.name)).encode('utf-8')).hexdigest()
+  max_age = app.config["CALENDAR_CACHE_SECONDS"]
+  if request.if_none_match.contains(etag):
+    response = Response(status=304)
+  else:
+    stamp = ics_datetime(datetime.utcnow()) + 'Z'
+    def generate():
+      yield ics_line('BEGIN', 'VCALENDAR')
+      yield ics_line('VERSION', '2.0')
+      yield ics_line('PRODID', '-//Fyyur//Calendar//EN')
+      yield ics_line('X-WR-CALNAME', ics_escape(entity.name))
+      shows = db.session.execute(
+        readers.calendar_shows(kind, entity.id, start, end).
+        execution_options(stream_results=True)).yield_per(200)
+      for show in shows:
+        yield (ics_line('BEGIN', 'VEVENT') +
+               ics_line('UID', 'show-%d@fyyur' % show.id) +
+               ics_line('DTSTAMP', stamp) +
+               ics_line('DTSTART', ics_datetime(show.start_time)) +
+               ics_line('DTEND', ics_datetime(show.end_time)) +
+               ics_line('SUMMARY', ics_escape('%s at %s' % (show.artist_name, show.venue_name))) +
+               ics_line('END', 'VEVENT'))
+      yield ics_line('END', 'VCALENDAR')
+    response = Response(stream_with_context(generate()), mimetype='text/calendar')
+  response.set_etag(etag)
+  response.cache_control.public = True
+  response.cache_control.max_age = max_age
+  return response
 
 
 # Endpoints.
 
 @app.route('/')
 def index():
-  return render_template('pages/home.html')
+  page = read(readers.home_page(app.config["SUMMARY_MAX_AGE_SECONDS"]))
+  return render_template('pages/home.html', **page)
 
 #  Venues
 @app.route('/venues')
 def venues():
-  #num_upcoming_shows should be aggregated based on 
-  # number of upcoming shows per venue.
-  
-  venues = Venue.query.all()
-  result = []
-  # get distnict city and states
-  distinct_venues = Venue.query.distinct(Venue.state, Venue.city)
-  for venue in distinct_venues:
-    pre_venues = []
-    for item in Venue.query.filter(Venue.state==venue.state, Venue.city==venue.city):
-      pre_venues.append({
-        "id": item.id,
-        "name": item.name,
-        "num_upcoming_shows": Show.query.
-        filter(Show.venue_id==item.id, Show.start_time > datetime.now()).count(),
-      })
-    result.append({
-        "city": venue.city,
-        "state": venue.state,
-        "venues": pre_venues
-        })
-
-  return render_template('pages/venues.html', areas=result)
+  # venues grouped by area, optionally filtered by genre, e.g. /venues?genre=Jazz
+  page = read(readers.venues_page(request.args.get('genre', ''),
+                                  app.config["SUMMARY_MAX_AGE_SECONDS"]))
+  return render_template('pages/venues.html', **page)
 
 @app.route('/venues/search', methods=['POST'])
+@search_limiter
 def search_venues():
   # get search term
   search_term = request.form.get('search_term', '')
-  # filter by search_term
-  result = Venue.query.filter(Venue.name.ilike('%'+search_term+'%')).all()
-  response={
-    "count": len(result),
-    "data": []
-  }
-  for venue in result:
-    response['data'].append({
-      "id": venue.id,
-      "name": venue.name,
-      "num_upcoming_shows": Show.query.
-      filter(Show.venue_id==venue.id, Show.start_time > datetime.now()).count(),
-    })
-
-  return render_template('pages/search_venues.html', results=response, search_term=search_term)
+  page = read(readers.search_page(Venue, Show.venue_id, search_term, search_cache,
+                                  app.config["SEARCH_MAX_RESULTS"]))
+  return render_template('pages/search_venues.html', **page)
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  past_shows = []
-  upcoming_shows = []
-  try:
-    venue = Venue.query.get(venue_id)
-    venue_shows = Show.query.join(Venue).filter(Show.venue_id==venue_id)
-    
-    for show in venue_shows:
-      if show.start_time > datetime.now():
-        upcoming_shows.append({
-        "artist_id": show.id,
-        "artist_name": show.artist_show.name,
-        "artist_image_link": show.artist_show.image_link,
-        "start_time": str(show.start_time)
-      })
-      else:
-        past_shows.append({
-          "artist_id": show.id,
-          "artist_name": show.artist_show.name,
-          "artist_image_link": show.artist_show.image_link,
-          "start_time": str(show.start_time)
-        })
-    result = {
-      "id": venue.id,
-      "name": venue.name,
-      "genres": venue.genres,
-      "address": venue.address,
-      "city": venue.city,
-      "state": venue.state,
-      "phone": venue.phone,
-      "website": venue.website,
-      "facebook_link": venue.facebook_link,
-      "seeking_talent": venue.seeking_talent,
-      "seeking_description": venue.seeking_description,
-      "image_link": venue.image_link,
-      "past_shows": past_shows,
-      "upcoming_shows": upcoming_shows,
-      "past_shows_count": len(past_shows),
-      "upcoming_shows_count": len(upcoming_shows),
-    }
-
-    return render_template('pages/show_venue.html', venue=result)
-  except:
+  page = read(readers.venue_page(venue_id, past_shows_cutoff(), name_cache))
+  if page is None:
     abort(404)
+  return render_template('pages/show_venue.html', **page)
+
+@app.route('/venues/<int:venue_id>/calendar')
+@calendar_limiter
+def venue_calendar(venue_id):
+  return render_calendar('venue', venue_id)
+
+@app.route('/venues/<int:venue_id>/calendar.ics')
+@calendar_limiter
+def venue_calendar_ics(venue_id):
+  return calendar_feed('venue', venue_id)
 
 @app.route('/venues/create', methods=['GET'])
 def create_venue_form():
@@ -158,7 +325,11 @@ def create_venue_submission():
                         genres=venue_form.genres.data
                         )
       db.session.add(new_venue)
+      db.session.flush()
+      notify('venue_created', {"venue_id": new_venue.id, "name": new_venue.name})
+      request_summary_refresh()
       db.session.commit()
+      search_cache.invalidate()
       flash('Venue ' + request.form['name'] + ' was successfully listed!')
       return render_template('pages/home.html')
     except:
@@ -173,98 +344,85 @@ def create_venue_submission():
     flash(venue_form.errors)
     return render_template('forms/new_venue.html', form=venue_form)
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-  # SQLAlchemy ORM to delete a record. 
-  # Handle cases where the session commit could fail.
-  try:    
-    current_venue = Venue.query.get(venue_id)
-    db.session.delete(current_venue)
+  # small venues are deleted in one statement, venues with a long show
+  # history are hidden now and purged in chunks by a background job
+  venue = Venue.query.filter(Venue.id==venue_id, Venue.active()).first_or_404()
+  background = False
+  try:
+    # counting stops one past the limit, the purge counts the rest
+    limit = app.config["VENUE_DELETE_INLINE_SHOWS"]
+    probe = db.select([Show.id]).where(Show.venue_id==venue_id).limit(limit + 1).subquery()
+    if db.session.query(db.func.count()).select_from(probe).scalar() > limit:
+      schedule_venue_purge(venue)
+      enqueue('purge_venue', {"venue_id": venue_id}, key='purge_venue:%d' % venue_id)
+      background = True
+    else:
+      delete_venue_now(venue)
+    notify('venue_deleted', {"venue_id": venue_id})
+    request_summary_refresh()
     db.session.commit()
-    # delete related shows
-    #related_shows = Show.query.filter(Show.venue_id=venue_id).delete()
+    search_cache.invalidate()
+    name_cache.invalidate('venue', venue_id)
   except:
     db.session.rollback()
     abort(500)
   finally:
     db.session.close()
 
+  if background:
+    return jsonify({"status": "pending",
+                    "progress_url": url_for('venue_deletion_status', venue_id=venue_id)}), 202
   return redirect(url_for('index'))
 
+@app.route('/venues/<int:venue_id>/deletion')
+def venue_deletion_status(venue_id):
+  # progress of a background venue purge
+  deletion = VenueDeletion.query.get_or_404(venue_id)
+  return jsonify({
+    "venue_id": deletion.venue_id,
+    "status": deletion.status,
+    "total_shows": deletion.total_shows,
+    "deleted_shows": deletion.deleted_shows,
+    "error": deletion.error,
+    "started_at": deletion.started_at.isoformat(),
+    "finished_at": deletion.finished_at.isoformat() if deletion.finished_at else None,
+  })
+
 #  Artists
 @app.route('/artists')
 def artists():
-  # get all artists
-  artists = Artist.query.with_entities(Artist.id, Artist.name).all()
-  return render_template('pages/artists.html', artists=artists)
+  # get all artists, optionally filtered by genre
+  page = read(readers.artists_page(request.args.get('genre', '')))
+  return render_template('pages/artists.html', **page)
 
 @app.route('/artists/search', methods=['POST'])
+@search_limiter
 def search_artists():
   # get search term
   search_term = request.form.get('search_term','')
-  # filter by search term
-  result = Artist.query.filter(Artist.name.ilike('%'+search_term+'%')).all()
-  response={
-    "count": len(result),
-    "data": []
-  }
-
-  for artist in result:
-    response["data"].append({
-      "id": artist.id,
-      "name": artist.name,
-      "num_upcoming_shows": Show.query.
-      filter(Show.artist_id==artist.id, Show.start_time > datetime.now()).count()
-    })
-  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+  page = read(readers.search_page(Artist, Show.artist_id, search_term, search_cache,
+                                  app.config["SEARCH_MAX_RESULTS"]))
+  return render_template('pages/search_artists.html', **page)
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
   # get specific artist based on id
-  # check if id exist
-  try:
-    selected_artist = Artist.query.get(artist_id)
-    # if artist exist
-    # get shows related to artist
-    shows = Show.query.join(Artist).filter(Artist.id==artist_id).all()
-    past_shows = []
-    upcoming_shows = []
-    for show in shows:
-      if show.start_time >= datetime.now():
-        upcoming_shows.append({
-          "venue_id": show.venue_id,
-          "venue_name": show.venue_shows.name,
-          "venue_image_link": show.venue_shows.image_link,
-          "start_time": str(show.start_time),
-        })
-      else:
-        past_shows.append({
-          "venue_id": show.venue_id,
-          "venue_name": show.venue_shows.name,
-          "venue_image_link": show.venue_shows.image_link,
-          "start_time": str(show.start_time),
-        })
-    result = {
-      "id": selected_artist.id,
-      "name": selected_artist.name,
-      "genres": selected_artist.genres,
-      "city": selected_artist.city,
-      "state": selected_artist.state,
-      "phone": selected_artist.phone,
-      "website": selected_artist.website,
-      "facebook_link": selected_artist.facebook_link,
-      "seeking_venue": selected_artist.seeking_venue,
-      "seeking_description": selected_artist.seeking_description,
-      "image_link": selected_artist.image_link,
-      "past_shows": past_shows,
-      "upcoming_shows": upcoming_shows,
-      "past_shows_count": len(past_shows),
-      "upcoming_shows_count": len(upcoming_shows),
-    }
-    return render_template('pages/show_artist.html', artist=result)
-  except:
+  page = read(readers.artist_page(artist_id, past_shows_cutoff(), name_cache))
+  if page is None:
     abort(404)
+  return render_template('pages/show_artist.html', **page)
+
+@app.route('/artists/<int:artist_id>/calendar')
+@calendar_limiter
+def artist_calendar(artist_id):
+  return render_calendar('artist', artist_id)
 
+@app.route('/artists/<int:artist_id>/calendar.ics')
+@calendar_limiter
+def artist_calendar_ics(artist_id):
+  return calendar_feed('artist', artist_id)
 
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
@@ -280,7 +438,9 @@ def edit_artist(artist_id):
                       facebook_link=artist.facebook_link,
                       website_link=artist.website,
                       seeking_venue=artist.seeking_venue,
-                      seeking_description=artist.seeking_description)
+                      seeking_description=artist.seeking_description,
+                      version=artist.version,
+                      original=snapshot(artist, ARTIST_EDITS))
     # TODO: populate form with fields from artist with ID <artist_id>
     return render_template('forms/edit_artist.html', form=form, artist=artist)
   except:
@@ -290,39 +450,69 @@ def edit_artist(artist_id):
   
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-  # TODO: take values from the form submitted, and update existing
-  # artist record with ID <artist_id> using the new attributes
+  # writes only the fields that changed, merged onto the latest
+  # version when the form was loaded at an older one
+  artist = Artist.query.get_or_404(artist_id)
+  form = ArtistForm(request.form)
+  if not form.validate():
+    flash("Please check all data is correct!")
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+  values = {"name": form.name.data,
+            "city": form.city.data,
+            "state": form.state.data,
+            "phone": form.phone.data,
+            "genres": form.genres.data,
+            "image_link": form.image_link.data,
+            "facebook_link": form.facebook_link.data,
+            "website": form.website_link.data,
+            "seeking_venue": form.seeking_venue.data,
+            "seeking_description": form.seeking_description.data}
+  original = parse_snapshot(form.original.data)
   try:
-    artist = Artist.query.get(artist_id)
-    form = ArtistForm(request.form)
-    if form.validate():
-      artist.name = form.name.data
-      artist.city = form.city.data
-      artist.state = form.state.data
-      artist.phone = form.phone.data
-      artist.genres = form.genres.data
-      artist.image_link = form.image_link.data
-      artist.facebook_link = form.facebook_link.data
-      artist.website = form.website_link.data
-      artist.seeking_venue = form.seeking_venue.data
-      artist.seeking_description = form.seeking_description.data
-
-      db.session.add(artist)
-      db.session.commit()
-      flash("Artist updated successfully!")
+    if not apply_edit(artist, form.version.data, values, original):
+      flash("Nothing to update")
       return redirect(url_for('show_artist', artist_id=artist_id))
-    else:
-      flash("Please check all data is correct!")
-      return render_template('forms/edit_artist.html', form=form, artist=artist)
+    notify('artist_updated', {"artist_id": artist.id, "name": artist.name})
+    request_summary_refresh()
+    db.session.commit()
+  except (EditConflict, StaleDataError):
+    db.session.rollback()
+    return edit_conflict('forms/edit_artist.html', 'artist', artist, form, values, original)
   except:
-    abort(404)
+    db.session.rollback()
+    flash("An error occurred")
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+  search_cache.invalidate()
+  name_cache.invalidate('artist', artist_id)
+  flash("Artist updated successfully!")
   return redirect(url_for('show_artist', artist_id=artist_id))
 
+def edit_conflict(template, kind, entity, form, values, original):
+  # someone saved in between: show the latest version with this
+  # submission's own changes on top, and name the fields both changed
+  mine = edited(values, original)
+  for attribute in values:
+    if attribute not in mine:
+      form[FORM_FIELDS.get(attribute, attribute)].data = getattr(entity, attribute)
+  form.original.data = snapshot(entity, values)
+  form.version.data = entity.version
+  form.version.raw_data = []
+  overlapping = [FORM_FIELDS.get(attribute, attribute)
+                 for attribute in overlaps(entity, values, original)]
+  if overlapping:
+    flash("This %s was changed by someone else while you were editing, your changes "
+          "weren't saved. You both changed: %s. Save again to keep your values."
+          % (kind, ', '.join(overlapping)))
+  else:
+    flash("This %s was changed by someone else while you were saving, your changes "
+          "weren't saved. Save again to apply them to the latest version." % kind)
+  return render_template(template, form=form, **{kind: entity}), 409
+
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   try:
     # get venue by id
-    venue = Venue.query.get(venue_id)
+    venue = Venue.query.filter(Venue.id==venue_id, Venue.active()).first()
     # initailize form with data
     form = VenueForm(name=venue.name,
                     city=venue.city, 
@@ -334,7 +524,9 @@ def edit_venue(venue_id):
                     facebook_link=venue.facebook_link,
                     website_link=venue.website,
                     seeking_talent=venue.seeking_talent,
-                    seeking_description=venue.seeking_description)
+                    seeking_description=venue.seeking_description,
+                    version=venue.version,
+                    original=snapshot(venue, VENUE_EDITS))
     return render_template('forms/edit_venue.html', form=form, venue=venue)
   except:
     abort(404)
@@ -342,32 +534,42 @@ def edit_venue(venue_id):
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
+  # same as edit_artist_submission
+  venue = Venue.query.filter(Venue.id==venue_id, Venue.active()).first_or_404()
+  form = VenueForm(request.form)
+  if not form.validate():
+    flash("Data is not valid")
+    return redirect(url_for('show_venue', venue_id=venue_id))
+  values = {"name": form.name.data,
+            "city": form.city.data,
+            "state": form.state.data,
+            "phone": form.phone.data,
+            "address": form.address.data,
+            "image_link": form.image_link.data,
+            "genres": form.genres.data,
+            "facebook_link": form.facebook_link.data,
+            "website": form.website_link.data,
+            "seeking_talent": form.seeking_talent.data,
+            "seeking_description": form.seeking_description.data}
+  original = parse_snapshot(form.original.data)
   try:
-    # venue record with ID <venue_id> using the new attributes
-    venue = Venue.query.get(venue_id)
-    form = VenueForm(request.form)
-    if form.validate():
-      venue.name = form.name.data
-      venue.city = form.city.data
-      venue.state = form.state.data
-      venue.phone = form.phone.data
-      venue.address = form.address.data
-      venue.image_link = form.image_link.data
-      venue.genres = form.genres.data
-      venue.facebook_link = form.facebook_link.data
-      venue.website = form.website_link.data
-      venue.seeking_talent = form.seeking_talent.data
-      venue.seeking_description = form.seeking_description.data
-      
-      db.session.add(venue)
-      db.session.commit()
-      flash("Venue updated successfully")
-      return redirect(url_for('show_venue', venue_id=venue_id))
-    else:
-      flash("Data is not valid")
+    if not apply_edit(venue, form.version.data, values, original):
+      flash("Nothing to update")
       return redirect(url_for('show_venue', venue_id=venue_id))
+    notify('venue_updated', {"venue_id": venue.id, "name": venue.name})
+    request_summary_refresh()
+    db.session.commit()
+  except (EditConflict, StaleDataError):
+    db.session.rollback()
+    return edit_conflict('forms/edit_venue.html', 'venue', venue, form, values, original)
   except:
-    abort(404)
+    db.session.rollback()
+    flash("An error occurred")
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
+  search_cache.invalidate()
+  name_cache.invalidate('venue', venue_id)
+  flash("Venue updated successfully")
+  return redirect(url_for('show_venue', venue_id=venue_id))
 
 @app.route('/artists/create', methods=['GET'])
 def create_artist_form():
@@ -394,7 +596,11 @@ def create_artist_submission():
                           seeking_description=form.seeking_description.data,
                           genres=form.genres.data)
       db.session.add(new_artist)
+      db.session.flush()
+      notify('artist_created', {"artist_id": new_artist.id, "name": new_artist.name})
+      request_summary_refresh()
       db.session.commit()
+      search_cache.invalidate()
       flash('Artist ' + request.form['name'] + ' was successfully listed!')
       return render_template('pages/home.html')
     except:
@@ -414,20 +620,9 @@ def create_artist_submission():
 
 @app.route('/shows')
 def shows():
-  # displays list of shows at /shows
-  shows = Show.query.join(Venue).all()
-  data = []
-  for val in shows:
-    temp = {
-      "venue_id": val.id,
-      "venue_name": val.venue_shows.name,
-      "artist_id": val.artist_id,
-      "artist_name": val.artist_show.name,
-      "artist_image_link": val.artist_show.image_link,
-      "start_time": str(val.start_time)
-    }
-    data.append(temp)
-  return render_template('pages/shows.html', shows=data)
+  # displays list of upcoming and recent shows at /shows
+  page = read(readers.shows_page(past_shows_cutoff(), name_cache))
+  return render_template('pages/shows.html', **page)
 
 @app.route('/shows/create')
 def create_shows():
@@ -438,42 +633,227 @@ def create_shows():
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   form = ShowForm(request.form)
-  if form.validate():
-    # check if venue_id exists in db
-    if form.venue_id.data:
-      try:
-        temp_venue_id = int(form.venue_id.data)
-        print(temp_venue_id)
-        venue = Venue.query.get(temp_venue_id)
-      except:
-        flash("Venue id doesn't exist")
-        return render_template('forms/new_show.html', form=form)
-    # check if artist_id exists in db
-    if form.artist_id.data:
-      try:
-        temp_artisit_id = int(form.artist_id.data)
-        artist = Artist.query.get(temp_artisit_id)
-      except:
-        flash("Artist id doesn't exist")
-        return render_template('forms/new_show.html', form=form)
-    try:
-      new_show = Show(start_time=form.start_time.data, 
-                      venue_id=form.venue_id.data,
-                      artist_id=form.artist_id.data)
-      db.session.add(new_show)
-      db.session.commit()
-      flash("New show successfully added!")
-      return render_template('pages/home.html')
-    except:
-      flash("An error occurred")
-      return render_template('forms/new_show.html', form=form) 
-  else:
+  if not form.validate():
     flash("form isn't vaild")
     return render_template('forms/new_show.html', form=form)
 
-  # on successful db insert, flash success
-  flash('Show was successfully listed!')
-  return render_template('pages/home.html')
+  venue_id = form.venue_id.data
+  artist_id = form.artist_id.data
+  start_time = form.start_time.data
+  end_time = start_time + timedelta(minutes=form.duration.data)
+  error = False
+  try:
+    # hold the venue and artist until commit so the
+    # overlap check below can't race another booking
+    lock_bookings([venue_id], [artist_id])
+    if db.session.query(Venue.id).filter(Venue.id==venue_id, Venue.active()).scalar() is None:
+      form.venue_id.errors.append("Venue id doesn't exist")
+      error = True
+    if db.session.query(Artist.id).filter(Artist.id==artist_id).scalar() is None:
+      form.artist_id.errors.append("Artist id doesn't exist")
+      error = True
+    if not error:
+      conflict = find_conflict(venue_id, artist_id, start_time, end_time,
+                               app.config["MAX_SHOW_MINUTES"])
+      if conflict is not None:
+        booked = "Venue" if conflict.venue_id == venue_id else "Artist"
+        form.start_time.errors.append(
+          "%s is already booked from %s to %s" % (booked, conflict.start_time, conflict.end_time))
+        error = True
+    if error:
+      db.session.rollback()
+      flash("Show couldn't be listed, please check the errors below")
+      return render_template('forms/new_show.html', form=form)
+
+    new_show = Show(start_time=start_time,
+                    end_time=end_time,
+                    venue_id=venue_id,
+                    artist_id=artist_id)
+    db.session.add(new_show)
+    notify('show_created', {"venue_id": venue_id, "artist_id": artist_id,
+                            "start_time": start_time, "end_time": end_time})
+    request_summary_refresh()
+    db.session.commit()
+    search_cache.invalidate()
+    flash('Show was successfully listed!')
+    return render_template('pages/home.html')
+  except:
+    db.session.rollback()
+    flash("An error occurred")
+    return render_template('forms/new_show.html', form=form)
+  finally:
+    db.session.close()
+
+@app.route('/shows/bulk', methods=['GET'])
+def bulk_shows_form():
+  form = BulkShowForm()
+  return render_template('forms/bulk_shows.html', form=form)
+
+@app.route('/shows/bulk', methods=['POST'])
+def bulk_shows_submission():
+  # schedule many shows at once, from the form or a JSON body of
+  # {"shows": [{"artist_id", "venue_id", "start_time", "duration"}]}
+  form = None
+  if request.is_json:
+    payload = request.get_json(silent=True) or {}
+    rows = payload.get("shows") if isinstance(payload, dict) else payload
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+      return jsonify({"error": "expected a list of shows"}), 400
+  else:
+    form = BulkShowForm(request.form)
+    if not form.validate():
+      flash("Please enter at least one show")
+      return render_template('forms/bulk_shows.html', form=form)
+    rows = []
+    for line in form.rows.data.splitlines():
+      if line.strip():
+        values = [value.strip() for value in line.split(',')]
+        rows.append(dict(zip(("artist_id", "venue_id", "start_time", "duration"), values)))
+
+  if len(rows) > app.config["BULK_SHOWS_MAX_ROWS"]:
+    message = "At most %d shows can be scheduled at once" % app.config["BULK_SHOWS_MAX_ROWS"]
+    if form is None:
+      return jsonify({"error": message}), 400
+    flash(message)
+    return render_template('forms/bulk_shows.html', form=form)
+
+  try:
+    results = schedule_shows(rows, app.config["DEFAULT_SHOW_MINUTES"],
+                             app.config["MAX_SHOW_MINUTES"])
+    created = [result["show"] for result in results if result["status"] == "created"]
+    if created:
+      notify('shows_created', *coalesce(created, ('venue_id', 'artist_id')))
+      request_summary_refresh()
+    db.session.commit()
+    if created:
+      search_cache.invalidate()
+  except:
+    db.session.rollback()
+    app.logger.exception("bulk scheduling failed")
+    if form is None:
+      return jsonify({"error": "An error occurred"}), 500
+    flash("An error occurred")
+    return render_template('forms/bulk_shows.html', form=form)
+  finally:
+    db.session.close()
+
+  created = len(created)
+  if form is None:
+    return jsonify({"created": created,
+                    "failed": len(results) - created,
+                    "rows": results})
+  flash("%d of %d shows were successfully listed!" % (created, len(results)))
+  return render_template('forms/bulk_shows.html', form=form, results=results)
+
+#  Live updates
+
+@app.route('/events')
+def events():
+  # Server-Sent Events stream of show_created, shows_created (bulk) and
+  # venue/artist created/updated/deleted events, ?venue_id= or
+  # ?artist_id= narrow it. Each stream holds a worker thread for as
+  # long as the client stays, so there are at most SSE_MAX_STREAMS per
+  # process (see gunicorn.conf.py); asgi.py serves them on its loop.
+  try:
+    filters = parse_filters(request.args)
+  except ValueError:
+    abort(400)
+  subscription = broadcaster.subscribe(filters, limit=app.config["SSE_MAX_STREAMS"])
+  if subscription is None:
+    return Response('Too many live update streams\n', 503,
+                    {"Retry-After": str(app.config["SSE_KEEPALIVE_SECONDS"])})
+  keepalive = app.config["SSE_KEEPALIVE_SECONDS"]
+
+  def stream():
+    try:
+      yield RETRY
+      while not subscription.overflowed:
+        try:
+          message = subscription.messages.get(timeout=keepalive)
+        except queue.Empty:
+          yield KEEPALIVE
+          continue
+        yield format_event(message)
+    finally:
+      broadcaster.unsubscribe(subscription)
+
+  return Response(stream(), mimetype='text/event-stream',
+                  headers={"Cache-Control": "no-cache",
+                           "X-Accel-Buffering": "no"})
+
+#  Health
+
+@app.route('/healthz/ready')
+def healthz_ready():
+  # 200 once this process has warmed up, 503 until then; a failed
+  # warm-up is started again once its backoff has passed
+  if warm_up.state == 'failed':
+    warm_up.start()
+  body = jsonify({"status": warm_up.status, "steps": warm_up.steps})
+  if warm_up.ready:
+    return body
+  return body, 503, {"Retry-After": "1"}
+
+#  Metrics
+
+@app.route('/metrics')
+def metrics_view():
+  # Prometheus text format, for this process
+  return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+#  Commands
+
+@app.cli.command('partitions')
+@click.option('--ahead', type=int, default=None,
+              help='Months of partitions to create past the current one.')
+@click.option('--retain', type=int, default=None,
+              help='Months of past partitions to keep attached.')
+@click.option('--archive/--drop', default=True,
+              help='Move detached partitions to the archive schema or drop them.')
+def partitions_command(ahead, retain, archive):
+  # create upcoming Show partitions and detach old ones
+  if ahead is None:
+    ahead = app.config["SHOW_PARTITIONS_AHEAD"]
+  if retain is None:
+    retain = app.config["SHOW_PARTITIONS_RETAIN"]
+  created, detached = maintain_partitions(ahead, retain, archive=archive)
+  for name in created:
+    click.echo('created ' + name)
+  for name in detached:
+    click.echo(('archived ' if archive else 'dropped ') + name)
+
+@app.cli.command('refresh-summaries')
+def refresh_summaries_command():
+  # rebuild the home page and venue area views now
+  refresh_summaries()
+  click.echo('summaries refreshed')
+
+@app.cli.command('warmup')
+@click.option('--top', type=int, default=None,
+              help='Busiest venues and artists to render.')
+def warmup_command(top):
+  # run the warm-up here, priming the database's buffers for the
+  # processes that follow; serving processes warm themselves
+  if top is not None:
+    warm_up.top = top
+  warm_up.run(echo=click.echo)
+  click.echo('ready')
+
+@app.cli.command('worker')
+@click.option('--concurrency', type=int, default=None,
+              help='Jobs run at the same time.')
+@click.option('--poll-interval', type=float, default=None,
+              help='Seconds to wait when the queue is empty.')
+def worker_command(concurrency, poll_interval):
+  # run queued and periodic background jobs until interrupted
+  worker = Worker(app,
+                  concurrency or app.config["WORKER_CONCURRENCY"],
+                  poll_interval or app.config["WORKER_POLL_SECONDS"])
+  click.echo('worker started with %d threads' % worker.concurrency)
+  try:
+    worker.run()
+  except KeyboardInterrupt:
+    click.echo('worker stopped')
 
 @app.errorhandler(404)
 def not_found_error(error):
@@ -483,6 +863,22 @@ def not_found_error(error):
 def server_error(error):
     return render_template('errors/500.html'), 500
 
+@app.errorhandler(503)
+def unavailable_error(error):
+    return render_template('errors/503.html'), 503, \
+      {"Retry-After": str(getattr(error, 'retry_after', None) or app.config["ADMISSION_RETRY_AFTER"])}
+
+@app.errorhandler(DBAPIError)
+def database_error(error):
+    # a statement cancelled by its timeout is the request's fault, not
+    # the server's: say so and let the client retry with less
+    if not is_statement_timeout(error):
+        raise error
+    db.session.rollback()
+    statement_timeouts_hit.inc(request.endpoint)
+    return render_template('errors/503.html', timed_out=True), 503, \
+      {"Retry-After": str(app.config["ADMISSION_RETRY_AFTER"])}
+
 
 if not app.debug:
     file_handler = FileHandler('error.log')
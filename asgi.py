@@ -0,0 +1,252 @@
+# ASGI entry point: the read endpoints and the live update stream are
+# served by an async app on asyncpg, everything else (forms, writes,
+# feeds) falls through to the regular Flask app. Run with e.g.
+#   uvicorn asgi:application --workers 4
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from quart import Quart, Response, abort, jsonify, render_template, request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+
+import readers
+from app import (app as wsgi_app, boot, warm_up, broadcaster, past_shows_cutoff, search_cache,
+                 name_cache, statement_timeouts, search_limiter, calendar_limiter)
+from events import parse_filters, format_event, RETRY, KEEPALIVE
+from guards import is_statement_timeout, statement_timeouts_hit
+from models import Venue, Artist, Show
+from utils import format_datetime
+from config import ASYNC_SQLALCHEMY_DATABASE_URI, ASYNC_POOL_SIZE, WSGI_THREADS
+
+read_app = Quart(__name__)
+read_app.config.from_mapping(wsgi_app.config)
+read_app.jinja_env.filters['datetime'] = format_datetime
+
+engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URI,
+                             pool_size=ASYNC_POOL_SIZE)
+Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def run(loader):
+  async with Session() as session:
+    return await readers.run_async(loader, session,
+                                   statement_timeouts.get(request.endpoint))
+
+async def open_connections():
+  # every asyncpg connection of the pool at once
+  connections = [await engine.connect() for _ in range(ASYNC_POOL_SIZE)]
+  for connection in connections:
+    await connection.execute(text('SELECT 1'))
+    await connection.close()
+
+async def compile_templates():
+  for name in read_app.jinja_env.list_templates():
+    if name.endswith('.html'):
+      read_app.jinja_env.get_template(name)
+
+async def render_pages():
+  client = read_app.test_client()
+  for url in ('/', '/venues', '/artists', '/shows'):
+    response = await client.get(url)
+    if response.status_code >= 500:
+      raise RuntimeError('%s answered %d' % (url, response.status_code))
+
+ASYNC_STEPS = (('async_connections', open_connections),
+               ('async_templates', compile_templates),
+               ('async_pages', render_pages))
+
+@read_app.before_serving
+async def start_listener():
+  # boot() starts the listener that keeps the caches in step with
+  # writes from every process and the Flask app's warm-up; it waits
+  # for the listener, so off the event loop. The async side, which
+  # serves the read pages, warms here and /healthz/ready waits for it.
+  loop = asyncio.get_running_loop()
+  # the Flask routes run on this pool, see ThreadedWsgiToAsgi
+  loop.set_default_executor(ThreadPoolExecutor(WSGI_THREADS, thread_name_prefix='wsgi'))
+  for name, step in ASYNC_STEPS:
+    warm_up.expect(name)
+  await loop.run_in_executor(None, boot)
+  for name, step in ASYNC_STEPS:
+    started = time.monotonic()
+    await step()
+    warm_up.finished(name, time.monotonic() - started)
+
+@read_app.after_serving
+async def close_engine():
+  await engine.dispose()
+
+
+# Endpoints, named as in app.py so templates resolve the same urls.
+
+@read_app.route('/')
+async def index():
+  page = await run(readers.home_page(read_app.config["SUMMARY_MAX_AGE_SECONDS"]))
+  return await render_template('pages/home.html', **page)
+
+@read_app.route('/venues')
+async def venues():
+  page = await run(readers.venues_page(request.args.get('genre', ''),
+                                       read_app.config["SUMMARY_MAX_AGE_SECONDS"]))
+  return await render_template('pages/venues.html', **page)
+
+@read_app.route('/venues/search', methods=['POST'])
+@search_limiter
+async def search_venues():
+  search_term = (await request.form).get('search_term', '')
+  page = await run(readers.search_page(Venue, Show.venue_id, search_term, search_cache,
+                                       read_app.config["SEARCH_MAX_RESULTS"]))
+  return await render_template('pages/search_venues.html', **page)
+
+@read_app.route('/venues/<int:venue_id>')
+async def show_venue(venue_id):
+  page = await run(readers.venue_page(venue_id, past_shows_cutoff(), name_cache))
+  if page is None:
+    abort(404)
+  return await render_template('pages/show_venue.html', **page)
+
+@read_app.route('/artists')
+async def artists():
+  page = await run(readers.artists_page(request.args.get('genre', '')))
+  return await render_template('pages/artists.html', **page)
+
+@read_app.route('/artists/search', methods=['POST'])
+@search_limiter
+async def search_artists():
+  search_term = (await request.form).get('search_term', '')
+  page = await run(readers.search_page(Artist, Show.artist_id, search_term, search_cache,
+                                       read_app.config["SEARCH_MAX_RESULTS"]))
+  return await render_template('pages/search_artists.html', **page)
+
+@read_app.route('/artists/<int:artist_id>')
+async def show_artist(artist_id):
+  page = await run(readers.artist_page(artist_id, past_shows_cutoff(), name_cache))
+  if page is None:
+    abort(404)
+  return await render_template('pages/show_artist.html', **page)
+
+@read_app.route('/shows')
+async def shows():
+  page = await run(readers.shows_page(past_shows_cutoff(), name_cache))
+  return await render_template('pages/shows.html', **page)
+
+@read_app.route('/venues/<int:venue_id>/calendar')
+@calendar_limiter
+async def venue_calendar(venue_id):
+  return await calendar('venue', venue_id)
+
+@read_app.route('/artists/<int:artist_id>/calendar')
+@calendar_limiter
+async def artist_calendar(artist_id):
+  return await calendar('artist', artist_id)
+
+async def calendar(kind, entity_id):
+  # the JSON API of the calendars, HTML ones go to the Flask app
+  try:
+    start, end = readers.calendar_window(request.args, read_app.config["CALENDAR_MAX_DAYS"])
+  except ValueError:
+    abort(400)
+  page = await run(readers.calendar_page(kind, entity_id, start, end))
+  if page is None:
+    abort(404)
+  return jsonify({
+    "id": page["entity"].id,
+    "name": page["entity"].name,
+    "from": start.isoformat(),
+    "to": end.isoformat(),
+    "shows": page["shows"],
+  })
+
+@read_app.route('/events')
+async def events():
+  # see app.events; here a stream costs a queue on the event loop
+  # rather than a thread, so it isn't capped
+  try:
+    filters = parse_filters(request.args)
+  except ValueError:
+    abort(400)
+  subscription = broadcaster.subscribe(filters, asyncio.get_running_loop())
+  keepalive = read_app.config["SSE_KEEPALIVE_SECONDS"]
+
+  async def stream():
+    try:
+      yield RETRY.encode('utf-8')
+      while not subscription.overflowed:
+        try:
+          message = await asyncio.wait_for(subscription.messages.get(), keepalive)
+        except asyncio.TimeoutError:
+          yield KEEPALIVE.encode('utf-8')
+          continue
+        yield format_event(message).encode('utf-8')
+    finally:
+      broadcaster.unsubscribe(subscription)
+
+  response = Response(stream(), mimetype='text/event-stream',
+                      headers={"Cache-Control": "no-cache",
+                               "X-Accel-Buffering": "no"})
+  # the stream stays open as long as the client does
+  response.timeout = None
+  return response
+
+@read_app.errorhandler(404)
+async def not_found_error(error):
+  return await render_template('errors/404.html'), 404
+
+@read_app.errorhandler(500)
+async def server_error(error):
+  return await render_template('errors/500.html'), 500
+
+@read_app.errorhandler(503)
+async def unavailable_error(error):
+  return await render_template('errors/503.html'), 503, \
+    {"Retry-After": str(getattr(error, 'retry_after', None) or read_app.config["ADMISSION_RETRY_AFTER"])}
+
+@read_app.errorhandler(DBAPIError)
+async def database_error(error):
+  # see app.database_error
+  if not is_statement_timeout(error):
+    raise error
+  statement_timeouts_hit.inc(request.endpoint)
+  return await render_template('errors/503.html', timed_out=True), 503, \
+    {"Retry-After": str(read_app.config["ADMISSION_RETRY_AFTER"])}
+
+
+# Dispatch.
+
+class ThreadedWsgiInstance(WsgiToAsgiInstance):
+  # asgiref runs every WSGI request on the one thread its
+  # thread-sensitive mode shares per process, which serializes all
+  # Flask routes; these run on the loop's default executor instead
+  run_wsgi_app = sync_to_async(WsgiToAsgiInstance.run_wsgi_app.func, thread_sensitive=False)
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+  async def __call__(self, scope, receive, send):
+    await ThreadedWsgiInstance(self.wsgi_application)(scope, receive, send)
+
+wsgi = ThreadedWsgiToAsgi(wsgi_app)
+read_routes = read_app.url_map.bind('')
+
+def is_async_route(scope):
+  if scope['type'] != 'http':
+    return False
+  # calendars are only served here as JSON
+  if scope['path'].endswith('/calendar') and b'format=json' not in scope['query_string']:
+    return False
+  try:
+    read_routes.match(scope['path'], method=scope['method'])
+  except (NotFound, MethodNotAllowed):
+    return False
+  return True
+
+async def application(scope, receive, send):
+  if scope['type'] == 'lifespan' or is_async_route(scope):
+    await read_app(scope, receive, send)
+  else:
+    await wsgi(scope, receive, send)
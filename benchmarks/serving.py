@@ -0,0 +1,81 @@
+# Compare the WSGI and ASGI deployments under the same read load.
+#
+#   gunicorn -w 4 app:app -b :8000
+#   uvicorn asgi:application --workers 4 --port 8001
+#   python benchmarks/serving.py http://localhost:8000 http://localhost:8001
+#
+# Each base url gets the same mix of requests from N client threads:
+# read pages, and a bulk scheduling POST (no row can be booked, so
+# nothing is written) that the ASGI app hands to Flask. The report is
+# requests per second and latency percentiles per server.
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+# (path, JSON body or None for a GET)
+UNKNOWN_VENUE = 2 ** 31 - 1
+PATHS = [('/', None), ('/venues', None), ('/artists', None), ('/shows', None),
+         ('/venues/1', None), ('/artists/1', None),
+         ('/shows/bulk', {"shows": [{"artist_id": 1, "venue_id": UNKNOWN_VENUE,
+                                     "start_time": "2030-01-01T20:00"}]})]
+
+
+def worker(base, deadline, latencies, errors):
+  i = 0
+  while time.monotonic() < deadline:
+    path, body = PATHS[i % len(PATHS)]
+    i += 1
+    request = Request(base + path)
+    if body is not None:
+      request.data = json.dumps(body).encode('utf-8')
+      request.add_header('Content-Type', 'application/json')
+    started = time.monotonic()
+    try:
+      with urlopen(request, timeout=30) as response:
+        response.read()
+    except (URLError, OSError):
+      errors.append(path)
+      continue
+    latencies.append(time.monotonic() - started)
+
+def bench(base, clients, seconds):
+  latencies, errors = [], []
+  deadline = time.monotonic() + seconds
+  threads = [threading.Thread(target=worker, args=(base, deadline, latencies, errors))
+             for _ in range(clients)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return latencies, errors
+
+def percentile(values, p):
+  return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark pages and a POST on one or more servers.')
+  parser.add_argument('urls', nargs='+', help='base url of each server')
+  parser.add_argument('-c', '--clients', type=int, default=50)
+  parser.add_argument('-d', '--seconds', type=float, default=30)
+  args = parser.parse_args()
+  print('%-28s %8s %8s %8s %8s %8s %7s' % ('server', 'req/s', 'mean', 'p50', 'p95', 'p99', 'errors'))
+  for base in args.urls:
+    latencies, errors = bench(base.rstrip('/'), args.clients, args.seconds)
+    if not latencies:
+      print('%-28s no successful requests (%d errors)' % (base, len(errors)))
+      continue
+    latencies.sort()
+    ms = lambda value: '%.1fms' % (value * 1000)
+    print('%-28s %8.1f %8s %8s %8s %8s %7d' % (
+      base, len(latencies) / args.seconds, ms(statistics.mean(latencies)),
+      ms(percentile(latencies, 50)), ms(percentile(latencies, 95)),
+      ms(percentile(latencies, 99)), len(errors)))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,168 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import Counter, Gauge
+
+#------------------------------------#
+# In-process caches for read pages.
+#------------------------------------#
+
+def normalize_term(term):
+  # "  The   JAZZ " and "the jazz" are the same search
+  return ' '.join(term.casefold().split())
+
+
+search_lookups = Counter('fyyur_search_cache_lookups_total',
+                         'Search cache lookups by result.', ('kind', 'result'))
+search_evictions = Counter('fyyur_search_cache_evictions_total',
+                           'Search results evicted to stay within the memory budget.')
+
+
+class SearchCache(object):
+  # Result rows of searches, keyed on (kind, normalized term), LRU
+  # within a byte budget and expiring after ttl seconds. Any write
+  # bumps the generation, which retires every older entry at once.
+  # While live() is false, i.e. writes elsewhere can't reach us, the
+  # cache neither answers nor stores.
+
+  def __init__(self, max_bytes, ttl, live=None):
+    self.max_bytes = max_bytes
+    self.ttl = ttl
+    self.live = live
+    self.entries = OrderedDict()
+    self.size = 0
+    self.generation = 0
+    self.lock = threading.Lock()
+    Gauge('fyyur_search_cache_bytes', 'Estimated size of the cached search results.',
+          callback=lambda: {(): self.size})
+    Gauge('fyyur_search_cache_entries', 'Cached searches.',
+          callback=lambda: {(): len(self.entries)})
+
+  def invalidate(self):
+    with self.lock:
+      self.generation += 1
+      self.entries.clear()
+      self.size = 0
+
+  def get(self, kind, term):
+    # (generation, rows), rows is None on a miss; the generation goes
+    # back to put() so results read across a write are never stored
+    key = (kind, term)
+    if self.live is not None and not self.live():
+      search_lookups.inc(kind, 'miss')
+      return self.generation, None
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None and entry[1] < time.monotonic():
+        self._drop(key)
+        entry = None
+      if entry is not None:
+        self.entries.move_to_end(key)
+      generation = self.generation
+    search_lookups.inc(kind, 'miss' if entry is None else 'hit')
+    return generation, entry[0] if entry is not None else None
+
+  def put(self, kind, term, generation, rows):
+    key = (kind, term)
+    size = _estimate_size(key, rows)
+    if size > self.max_bytes or (self.live is not None and not self.live()):
+      return
+    with self.lock:
+      if generation != self.generation:
+        return
+      if key in self.entries:
+        self._drop(key)
+      self.entries[key] = (rows, time.monotonic() + self.ttl, size)
+      self.size += size
+      while self.size > self.max_bytes:
+        self._drop(next(iter(self.entries)))
+        search_evictions.inc()
+
+  def _drop(self, key):
+    rows, expires, size = self.entries.pop(key)
+    self.size -= size
+
+
+def _estimate_size(key, rows):
+  # close enough for a budget: containers plus their strings and numbers
+  size = sys.getsizeof(key) + sum(sys.getsizeof(part) for part in key)
+  size += sys.getsizeof(rows)
+  for row in rows:
+    size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+  return size
+
+
+name_lookups = Counter('fyyur_name_cache_lookups_total',
+                       'Venue/artist display field lookups by result.', ('kind', 'result'))
+
+
+class Listing(object):
+  # what a show tile shows of a venue or artist
+  __slots__ = ('id', 'name', 'image_link')
+
+  def __init__(self, id, name, image_link):
+    self.id = id
+    self.name = name
+    self.image_link = image_link
+
+
+# stands in for an id that resolved to no row
+_ABSENT = object()
+
+
+class NameCache(object):
+  # id -> Listing per kind ('venue', 'artist'), warmed with every
+  # active row and dropped per id when one is edited or deleted.
+  # Deleted venues are left out, so their shows resolve to nothing;
+  # ids looked up without a row are remembered as absent.
+
+  def __init__(self):
+    self.records = {"venue": {}, "artist": {}}
+    self.generation = 0
+    self.lock = threading.Lock()
+    Gauge('fyyur_name_cache_entries', 'Cached venue/artist display fields.', ('kind',),
+          callback=lambda: {(kind,): len(records) for kind, records in self.records.items()})
+
+  def lookup(self, kind, ids):
+    # (generation, {id: Listing}, missing ids)
+    records = self.records[kind]
+    found = {}
+    missing = set()
+    with self.lock:
+      for id in ids:
+        record = records.get(id)
+        if record is None:
+          missing.add(id)
+        elif record is not _ABSENT:
+          found[id] = record
+      generation = self.generation
+    if len(ids) > len(missing):
+      name_lookups.inc(kind, 'hit', amount=len(ids) - len(missing))
+    if missing:
+      name_lookups.inc(kind, 'miss', amount=len(missing))
+    return generation, found, missing
+
+  def fill(self, kind, rows, generation, ids=()):
+    # Listings for (id, name, image_link) rows, and ids without a row
+    # as absent; kept unless something was invalidated since
+    # generation was read
+    listings = {row[0]: Listing(*row) for row in rows}
+    with self.lock:
+      if generation == self.generation:
+        records = self.records[kind]
+        records.update(dict.fromkeys(ids, _ABSENT))
+        records.update(listings)
+    return listings
+
+  def invalidate(self, kind, id):
+    with self.lock:
+      self.generation += 1
+      self.records[kind].pop(id, None)
+
+  def clear(self):
+    with self.lock:
+      self.generation += 1
+      for records in self.records.values():
+        records.clear()
@@ -0,0 +1,66 @@
+from datetime import datetime
+
+from models import db, Venue, Show, VenueDeletion
+
+#------------------------------------#
+# Venue purges.
+#------------------------------------#
+
+def delete_venue_now(venue):
+  # one set-based DELETE, the database cascades to shows and genres
+  venue.genre_items = []
+  db.session.flush()
+  Venue.query.filter(Venue.id == venue.id).delete(synchronize_session=False)
+
+
+def schedule_venue_purge(venue):
+  # hide the venue right away, purge_venue removes it in chunks later.
+  # Its genres go now too, so the facet counts drop it at once.
+  venue.deleted_at = datetime.now()
+  venue.genre_items = []
+  deletion = VenueDeletion.query.get(venue.id) or VenueDeletion(venue_id=venue.id)
+  deletion.status = 'pending'
+  # counted when the purge starts
+  deletion.total_shows = 0
+  deletion.deleted_shows = 0
+  deletion.error = None
+  deletion.started_at = datetime.now()
+  deletion.finished_at = None
+  db.session.add(deletion)
+  return deletion
+
+
+def purge_venue(venue_id, chunk_size):
+  # delete the venue's shows chunk_size rows per transaction so no
+  # lock is held for long, recording progress as it goes
+  deletion = VenueDeletion.query.get(venue_id)
+  if deletion is None or deletion.status == 'done':
+    return
+  deletion.status = 'running'
+  deletion.total_shows = deletion.deleted_shows + db.session.query(db.func.count(Show.id)).\
+    filter(Show.venue_id == venue_id).scalar()
+  db.session.commit()
+  try:
+    while True:
+      chunk = db.session.query(Show.id, Show.start_time).\
+        filter(Show.venue_id == venue_id).limit(chunk_size).subquery()
+      deleted = Show.query.filter(
+        db.tuple_(Show.id, Show.start_time).in_(
+          db.select([chunk.c.id, chunk.c.start_time]))).\
+        delete(synchronize_session=False)
+      deletion.deleted_shows = VenueDeletion.deleted_shows + deleted
+      db.session.commit()
+      if deleted < chunk_size:
+        break
+    venue = Venue.query.get(venue_id)
+    if venue is not None:
+      delete_venue_now(venue)
+    deletion.status = 'done'
+    deletion.finished_at = datetime.now()
+    db.session.commit()
+  except Exception as e:
+    db.session.rollback()
+    deletion.status = 'failed'
+    deletion.error = str(e)
+    db.session.commit()
+    raise
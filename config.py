@@ -11,4 +11,98 @@ DEBUG = True
 
 
 # TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql:///fyyur'
+# FYYUR_DATABASE_URL overrides it, e.g. for the test database
+SQLALCHEMY_DATABASE_URI = os.environ.get('FYYUR_DATABASE_URL', 'postgresql:///fyyur')
+# same database through asyncpg, for the async read app in asgi.py
+ASYNC_SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace(
+    'postgresql://', 'postgresql+asyncpg://', 1)
+ASYNC_POOL_SIZE = 20
+# threads per process running the Flask routes under asgi.py, within
+# the Flask engine's default pool of 5 + 10 overflow connections
+WSGI_THREADS = 15
+
+
+# Show partitioning, in months
+SHOW_PARTITIONS_AHEAD = 3
+SHOW_PARTITIONS_RETAIN = 24
+
+# how far back past shows are listed, keeps
+# page queries on the most recent partitions
+PAST_SHOWS_WINDOW_DAYS = 180
+
+# longest window a calendar request may ask for
+CALENDAR_MAX_DAYS = 92
+# seconds clients and proxies may cache a calendar window
+CALENDAR_CACHE_SECONDS = 300
+
+# show lengths, in minutes
+DEFAULT_SHOW_MINUTES = 120
+MAX_SHOW_MINUTES = 24 * 60
+
+# most shows accepted by one bulk scheduling request
+BULK_SHOWS_MAX_ROWS = 500
+
+# venues with more shows than this are deleted in the background,
+# VENUE_PURGE_CHUNK shows per transaction
+VENUE_DELETE_INLINE_SHOWS = 1000
+VENUE_PURGE_CHUNK = 1000
+
+# background jobs (`flask worker`)
+WORKER_CONCURRENCY = 4
+WORKER_POLL_SECONDS = 1.0
+# a running job not finished after this long is requeued
+JOB_LEASE_SECONDS = 15 * 60
+# retry delays double from JOB_BACKOFF_SECONDS up to the max
+JOB_BACKOFF_SECONDS = 10
+JOB_BACKOFF_MAX_SECONDS = 60 * 60
+# periodic jobs, in seconds
+PARTITION_MAINTENANCE_SECONDS = 24 * 60 * 60
+GENRE_COUNTS_REFRESH_SECONDS = 60 * 60
+JOB_PRUNE_SECONDS = 24 * 60 * 60
+# days finished jobs are kept before prune_jobs deletes them
+JOB_RETAIN_DONE_DAYS = 7
+JOB_RETAIN_FAILED_DAYS = 30
+
+# summary views behind the home page and /venues: pages fall back to
+# the live tables once they are older than SUMMARY_MAX_AGE_SECONDS
+SUMMARY_MAX_AGE_SECONDS = 5 * 60
+SUMMARY_REFRESH_SECONDS = 2 * 60
+
+# live updates (/events): events buffered per client before
+# a slow client is dropped, and seconds between keep-alives
+SSE_BUFFER_SIZE = 100
+SSE_KEEPALIVE_SECONDS = 15
+# open streams per Flask process, each holds one of its threads
+SSE_MAX_STREAMS = 16
+# seconds a booting process waits for its event listener to connect
+LISTENER_START_SECONDS = 5
+
+# search results kept per process, in bytes, and their lifetime in seconds
+SEARCH_CACHE_BYTES = 8 * 1024 * 1024
+SEARCH_CACHE_SECONDS = 60
+
+# statement_timeout per endpoint in milliseconds, 'default' for the rest
+STATEMENT_TIMEOUTS = {
+  'default': 5000,
+  'search_venues': 1000,
+  'search_artists': 1000,
+  'venue_calendar': 2000,
+  'artist_calendar': 2000,
+  'venue_calendar_ics': 2000,
+  'artist_calendar_ics': 2000,
+}
+# matches listed per search before asking for a narrower term
+SEARCH_MAX_RESULTS = 50
+# requests per process let into each group of expensive endpoints at
+# once, others get a 503 asking to retry after this many seconds
+ADMISSION_LIMITS = {'search': 8, 'calendar': 8}
+ADMISSION_RETRY_AFTER = 5
+
+# warm-up of new processes: busiest venues and artists rendered, and
+# whether a booting process starts it in the background
+WARMUP_TOP = 20
+WARMUP_ON_START = True
+# a failed warm-up is retried after WARMUP_RETRY_SECONDS, doubling
+# up to the max
+WARMUP_RETRY_SECONDS = 5
+WARMUP_RETRY_MAX_SECONDS = 5 * 60
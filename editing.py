@@ -0,0 +1,117 @@
+import json
+
+from sqlalchemy import update
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import set_committed_value
+
+#------------------------------------#
+# Venue and artist edits.
+#------------------------------------#
+# An edit form carries the version it was loaded at. A submission is
+# compared with the stored row and only the columns that differ are
+# set, so the UPDATE names just those; the mapper's version_id_col
+# adds "AND version = :old" to it. An edit that started from an older
+# version is merged: the form also carries the values it was loaded
+# with, and only the fields the user changed from those are applied
+# on top of the latest row, unless a newer edit changed one of them
+# too.
+
+# attributes the edit forms change, their fields are named alike
+# except for those in FORM_FIELDS
+VENUE_EDITS = ('name', 'city', 'state', 'phone', 'address', 'image_link', 'genres',
+               'facebook_link', 'website', 'seeking_talent', 'seeking_description')
+ARTIST_EDITS = ('name', 'city', 'state', 'phone', 'genres', 'image_link',
+                'facebook_link', 'website', 'seeking_venue', 'seeking_description')
+FORM_FIELDS = {"website": "website_link"}
+
+
+class EditConflict(Exception):
+  # the entity changed since the edit form was loaded
+  pass
+
+
+def _same(current, value):
+  # forms submit '' for empty fields, rows may hold NULL
+  if current in (None, '') and value in (None, ''):
+    return True
+  return current == value
+
+def _differs(attribute, current, value):
+  # genres compare as sets, their order carries no meaning
+  if attribute == 'genres':
+    return set(current or ()) != set(value or ())
+  return not _same(current, value)
+
+def changes(entity, values):
+  # {attribute: value} for the values that differ from entity's
+  return {attribute: value for attribute, value in values.items()
+          if _differs(attribute, getattr(entity, attribute), value)}
+
+def snapshot(entity, attributes):
+  # the attributes as the edit form is loaded with them, carried on
+  # the form as JSON
+  values = {}
+  for attribute in attributes:
+    value = getattr(entity, attribute)
+    values[attribute] = list(value) if attribute == 'genres' else value
+  return json.dumps(values)
+
+def parse_snapshot(text):
+  # the values a submitted form was loaded with, None when missing
+  try:
+    original = json.loads(text or '')
+  except ValueError:
+    return None
+  return original if isinstance(original, dict) else None
+
+def edited(values, original):
+  # the values the user changed from those the form was loaded with,
+  # all of them when that isn't known
+  if original is None:
+    return dict(values)
+  return {attribute: value for attribute, value in values.items()
+          if attribute not in original or _differs(attribute, original[attribute], value)}
+
+def overlaps(entity, values, original):
+  # attributes the user changed that a newer edit of entity changed
+  # as well, to something else
+  overlapping = []
+  for attribute, value in edited(values, original).items():
+    current = getattr(entity, attribute)
+    if not _differs(attribute, current, value):
+      continue
+    if original is None or attribute not in original or \
+        _differs(attribute, original[attribute], current):
+      overlapping.append(attribute)
+  return sorted(overlapping)
+
+def apply_edit(entity, version, values, original=None):
+  # sets the changed attributes and returns them, nothing to write
+  # when it's empty. When entity has moved past version only the
+  # user's changes from original are applied, and EditConflict is
+  # raised if they overlap the newer ones; a change racing this one
+  # surfaces as StaleDataError at flush.
+  if version != entity.version:
+    if original is None or overlaps(entity, values, original):
+      raise EditConflict()
+    values = edited(values, original)
+  changed = changes(entity, values)
+  if set(changed) == {'genres'}:
+    # only association rows change, which doesn't UPDATE the entity:
+    # check and bump the version by hand
+    bump_version(entity)
+  for attribute, value in changed.items():
+    setattr(entity, attribute, value)
+  return changed
+
+def bump_version(entity):
+  # UPDATE ... SET version = version + 1 over the loaded version only,
+  # EditConflict when another edit got there first
+  table = type(entity).__table__
+  result = object_session(entity).execute(
+    update(table).
+    where(table.c.id == entity.id, table.c.version == entity.version).
+    values(version=table.c.version + 1))
+  if result.rowcount != 1:
+    raise EditConflict()
+  set_committed_value(entity, 'version', entity.version + 1)
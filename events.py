@@ -0,0 +1,198 @@
+import asyncio
+import json
+import queue
+import select
+import threading
+import time
+
+from models import db
+
+#------------------------------------#
+# Live updates over Postgres LISTEN/NOTIFY.
+#------------------------------------#
+# Views call notify() inside their transaction; Postgres delivers the
+# event on commit to every app process. In each process one listener
+# connection fans the events out to the connected SSE clients, each
+# with a bounded buffer.
+
+CHANNEL = 'fyyur_events'
+
+
+def notify(event, *items):
+  # one event per item, sent in a single statement
+  if not items:
+    return
+  payloads = [{"event": event, "data": item} for item in items]
+  db.session.execute(db.text(
+    'SELECT pg_notify(:channel, value::text) '
+    'FROM jsonb_array_elements(CAST(:payloads AS jsonb)) AS value'),
+    {"channel": CHANNEL, "payloads": json.dumps(payloads, default=str)})
+
+
+def coalesce(items, keys, size=100):
+  # one summary per `size` items, listing their ids under e.g.
+  # "venue_ids", keeps a bulk write to a few events that each fit
+  # in the 8000 byte NOTIFY payload and a subscriber's buffer
+  for start in range(0, len(items), size):
+    chunk = items[start:start + size]
+    summary = {"count": len(chunk)}
+    for key in keys:
+      summary[key + 's'] = sorted({item[key] for item in chunk})
+    yield summary
+
+
+def parse_filters(args):
+  # {"venue_id": 3} from ?venue_id=3 and/or ?artist_id=, ValueError
+  # when one isn't a number
+  filters = {}
+  for key in ('venue_id', 'artist_id'):
+    if args.get(key):
+      filters[key] = int(args[key])
+  return filters
+
+
+# the chunks of an SSE stream
+RETRY = 'retry: 5000\n\n'
+KEEPALIVE = ': keep-alive\n\n'
+
+def format_event(message):
+  return 'event: %s\ndata: %s\n\n' % (message["event"], json.dumps(message["data"]))
+
+
+class Subscription(object):
+  __slots__ = ('messages', 'filters', 'overflowed')
+
+  def __init__(self, buffer_size, filters):
+    self.messages = queue.Queue(maxsize=buffer_size)
+    # e.g. {"venue_id": 3}, only events matching every key are sent
+    self.filters = filters
+    self.overflowed = False
+
+  def wants(self, data):
+    # coalesced events match when any of their ids does
+    return all(data.get(key) == value or value in data.get(key + 's', ())
+               for key, value in self.filters.items())
+
+  def offer(self, message):
+    # False once the client has fallen a whole buffer behind
+    try:
+      self.messages.put_nowait(message)
+    except queue.Full:
+      self.overflowed = True
+    return not self.overflowed
+
+
+class AsyncSubscription(Subscription):
+  # for a client served on an event loop: the listener thread hands
+  # each message over to an asyncio.Queue on that loop
+  __slots__ = ('loop',)
+
+  def __init__(self, buffer_size, filters, loop):
+    super().__init__(buffer_size, filters)
+    self.messages = asyncio.Queue(maxsize=buffer_size)
+    self.loop = loop
+
+  def offer(self, message):
+    try:
+      self.loop.call_soon_threadsafe(self.put, message)
+    except RuntimeError:
+      # the loop has closed
+      self.overflowed = True
+    return not self.overflowed
+
+  def put(self, message):
+    try:
+      self.messages.put_nowait(message)
+    except asyncio.QueueFull:
+      self.overflowed = True
+
+
+class Broadcaster(object):
+
+  def __init__(self, buffer_size=100, poll_seconds=5.0):
+    self.buffer_size = buffer_size
+    self.poll_seconds = poll_seconds
+    self.subscriptions = set()
+    self.lock = threading.Lock()
+    self.listener = None
+    self.engine = None
+    # set while the listener connection is subscribed to the channel
+    self.listening = threading.Event()
+    # called with every event before it is sent to the clients
+    self.handlers = []
+    # called whenever the listener (re)subscribes, events sent while
+    # it wasn't listening are lost
+    self.reset_handlers = []
+
+  def start(self, engine):
+    # the listener thread starts once per process, when it boots
+    with self.lock:
+      if self.listener is None:
+        self.engine = engine
+        self.listener = threading.Thread(target=self.listen, name='event-listener',
+                                         daemon=True)
+        self.listener.start()
+
+  def add_handler(self, handler):
+    self.handlers.append(handler)
+
+  def add_reset_handler(self, handler):
+    self.reset_handlers.append(handler)
+
+  def subscribe(self, filters=None, loop=None, limit=None):
+    # an AsyncSubscription when given the client's event loop, None
+    # when limit subscriptions are open already
+    if loop is not None:
+      subscription = AsyncSubscription(self.buffer_size, filters or {}, loop)
+    else:
+      subscription = Subscription(self.buffer_size, filters or {})
+    with self.lock:
+      if limit is not None and len(self.subscriptions) >= limit:
+        return None
+      self.subscriptions.add(subscription)
+    return subscription
+
+  def unsubscribe(self, subscription):
+    with self.lock:
+      self.subscriptions.discard(subscription)
+
+  def publish(self, payload):
+    message = json.loads(payload)
+    for handler in self.handlers:
+      handler(message)
+    with self.lock:
+      subscriptions = list(self.subscriptions)
+    for subscription in subscriptions:
+      if subscription.wants(message["data"]) and not subscription.offer(message):
+        # a client that can't keep up is dropped rather than
+        # buffering without bound, EventSource reconnects it
+        self.unsubscribe(subscription)
+
+  def listen(self):
+    while True:
+      connection = None
+      try:
+        # a connection of its own, detached from the pool
+        fairy = self.engine.raw_connection()
+        fairy.detach()
+        connection = fairy.connection
+        connection.autocommit = True
+        connection.cursor().execute('LISTEN %s' % CHANNEL)
+        for handler in self.reset_handlers:
+          handler()
+        self.listening.set()
+        while True:
+          if select.select([connection], [], [], self.poll_seconds) == ([], [], []):
+            continue
+          connection.poll()
+          while connection.notifies:
+            self.publish(connection.notifies.pop(0).payload)
+      except Exception:
+        # reconnect after a short pause, e.g. when Postgres restarts
+        self.listening.clear()
+        if connection is not None:
+          try:
+            connection.close()
+          except Exception:
+            pass
+        time.sleep(self.poll_seconds)
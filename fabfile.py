@@ -1,3 +1,5 @@
+import time
+
 from fabric.api import local, settings, abort
 from fabric.contrib.console import confirm
 
@@ -7,7 +9,7 @@ from fabric.contrib.console import confirm
 def test():
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m pytest tests", capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
@@ -38,6 +40,28 @@ def heroku():
     local("git push heroku master")
 
 
+def warmup(attempts=120, streak=20):
+    # prime the database from a one-off dyno, then wait until the web
+    # dynos report ready. Each dyno warms itself when it boots; the
+    # router sends every probe to a random dyno, so only a streak of
+    # ready answers makes it likely that all of them are.
+    local("heroku run flask warmup")
+    local("heroku ps:wait --type web")
+    web_url = local("heroku info -s | grep '^web_url=' | cut -d= -f2", capture=True)
+    ready = 0
+    with settings(warn_only=True):
+        for _ in range(int(attempts)):
+            if local("curl -sf -o /dev/null {}healthz/ready".format(web_url)).succeeded:
+                ready += 1
+                if ready >= int(streak):
+                    return
+                time.sleep(0.5)
+            else:
+                ready = 0
+                time.sleep(5)
+    abort("The app didn't report ready.")
+
+
 def heroku_test():
     local(
         "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
@@ -49,6 +73,7 @@ def deploy():
     test()
     commit()
     heroku()
+    warmup()
     heroku_test()
 
 # rollback
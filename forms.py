@@ -1,20 +1,36 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField, TextAreaField
+from wtforms.validators import DataRequired, AnyOf, URL, NumberRange, Optional
+from wtforms.widgets import HiddenInput
+
+from config import DEFAULT_SHOW_MINUTES, MAX_SHOW_MINUTES
+from scheduling import MAX_ID
 
 class ShowForm(Form):
-    artist_id = StringField(
-        'artist_id'
+    artist_id = IntegerField(
+        'artist_id', validators=[DataRequired(), NumberRange(min=1, max=MAX_ID)]
     )
-    venue_id = StringField(
-        'venue_id'
+    venue_id = IntegerField(
+        'venue_id', validators=[DataRequired(), NumberRange(min=1, max=MAX_ID)]
     )
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
         default= datetime.today()
     )
+    duration = IntegerField(
+        # minutes
+        'duration',
+        validators=[DataRequired(), NumberRange(min=1, max=MAX_SHOW_MINUTES)],
+        default=DEFAULT_SHOW_MINUTES
+    )
+
+class BulkShowForm(Form):
+    # one "artist_id, venue_id, start_time[, duration]" per line
+    rows = TextAreaField(
+        'rows', validators=[DataRequired()]
+    )
 
 class VenueForm(Form):
     name = StringField(
@@ -126,6 +142,15 @@ class VenueForm(Form):
         'seeking_description'
     )
 
+    # version the edit form was loaded at, empty when creating
+    version = IntegerField(
+        'version', validators=[Optional()], widget=HiddenInput()
+    )
+    # JSON of the values the edit form was loaded with
+    original = StringField(
+        'original', widget=HiddenInput()
+    )
+
 class ArtistForm(Form):
     name = StringField(
         'name', validators=[DataRequired()]
@@ -235,3 +260,11 @@ class ArtistForm(Form):
             'seeking_description'
      )
 
+    # version the edit form was loaded at, empty when creating
+    version = IntegerField(
+        'version', validators=[Optional()], widget=HiddenInput()
+    )
+    # JSON of the values the edit form was loaded with
+    original = StringField(
+        'original', widget=HiddenInput()
+    )
@@ -0,0 +1,92 @@
+import functools
+import inspect
+import threading
+
+from werkzeug.exceptions import ServiceUnavailable
+
+from metrics import Counter, Gauge
+
+#------------------------------------#
+# Guardrails for expensive endpoints.
+#------------------------------------#
+# Statements run under a per-endpoint statement_timeout, and endpoints
+# that can tie up a worker and a connection are admitted a few at a
+# time per process; the rest are turned away with 503 and Retry-After
+# instead of queueing behind them.
+
+statement_timeouts_hit = Counter('fyyur_statement_timeouts_total',
+                                 'Requests cancelled by their statement_timeout.',
+                                 ('endpoint',))
+admission_rejected = Counter('fyyur_admission_rejected_total',
+                             'Requests turned away by a concurrency limit.', ('group',))
+
+_limiters = {}
+Gauge('fyyur_admission_limit', 'Requests admitted at once per process.', ('group',),
+      callback=lambda: {(name,): limiter.limit for name, limiter in _limiters.items()})
+Gauge('fyyur_admission_in_flight', 'Requests currently admitted.', ('group',),
+      callback=lambda: {(name,): limiter.in_flight for name, limiter in _limiters.items()})
+
+
+class StatementTimeouts(object):
+  # milliseconds per endpoint name, 'default' for the rest
+
+  def __init__(self, timeouts):
+    self.timeouts = timeouts
+    Gauge('fyyur_statement_timeout_milliseconds', 'statement_timeout per endpoint.',
+          ('endpoint',), callback=lambda: {(endpoint,): ms for endpoint, ms
+                                           in self.timeouts.items()})
+
+  def get(self, endpoint):
+    return self.timeouts.get(endpoint, self.timeouts['default'])
+
+
+def is_statement_timeout(error):
+  # query_canceled, from psycopg2 (pgcode) or asyncpg (sqlstate)
+  orig = getattr(error, 'orig', None)
+  return (getattr(orig, 'pgcode', None) or getattr(orig, 'sqlstate', None)) == '57014'
+
+
+class Limiter(object):
+  # decorates sync or async views; never blocks, a request either
+  # gets a slot now or a 503
+
+  def __init__(self, name, limit, retry_after):
+    self.name = name
+    self.limit = limit
+    self.retry_after = retry_after
+    self.in_flight = 0
+    self.lock = threading.Lock()
+    _limiters[name] = self
+
+  def acquire(self):
+    with self.lock:
+      if self.in_flight >= self.limit:
+        admission_rejected.inc(self.name)
+        return False
+      self.in_flight += 1
+      return True
+
+  def release(self):
+    with self.lock:
+      self.in_flight -= 1
+
+  def __call__(self, view):
+    if inspect.iscoroutinefunction(view):
+      @functools.wraps(view)
+      async def limited(*args, **kwargs):
+        if not self.acquire():
+          raise ServiceUnavailable(retry_after=self.retry_after)
+        try:
+          return await view(*args, **kwargs)
+        finally:
+          self.release()
+    else:
+      @functools.wraps(view)
+      def limited(*args, **kwargs):
+        if not self.acquire():
+          raise ServiceUnavailable(retry_after=self.retry_after)
+        try:
+          return view(*args, **kwargs)
+        finally:
+          self.release()
+    return limited
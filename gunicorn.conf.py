@@ -0,0 +1,14 @@
+# gunicorn reads this from the working directory, e.g.
+#   gunicorn -w 4 app:app -b :8000
+
+# threads rather than sync workers: an /events stream holds its
+# thread while the client stays connected, app.events caps them at
+# SSE_MAX_STREAMS per worker so the other threads keep serving pages
+worker_class = 'gthread'
+threads = 32
+
+
+def post_fork(server, worker):
+  # threads don't survive a fork, so each worker starts its own
+  from app import boot
+  boot()
@@ -0,0 +1,212 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Job
+
+#------------------------------------#
+# Background jobs.
+#------------------------------------#
+# Views enqueue work in their own transaction with enqueue(); it is
+# stored in the Job table and run by `flask worker`, which retries
+# failures with exponential backoff and enqueues periodic jobs.
+
+_registry = {}
+
+
+class JobSpec(object):
+  __slots__ = ('name', 'func', 'max_attempts', 'every')
+
+  def __init__(self, name, func, max_attempts, every):
+    self.name = name
+    self.func = func
+    self.max_attempts = max_attempts
+    # seconds between runs of a periodic job, or the config key holding it
+    self.every = every
+
+
+def job(name, max_attempts=5, every=None):
+  # register a function as a job, called with the payload as kwargs
+  def decorator(func):
+    _registry[name] = JobSpec(name, func, max_attempts, every)
+    return func
+  return decorator
+
+
+def enqueue_statement(name, payload=None, key=None, delay=0):
+  # INSERT for a new job. with a key it does nothing while an
+  # equal job is queued or running.
+  spec = _registry[name]
+  now = datetime.now()
+  statement = insert(Job.__table__).values(
+    name=name,
+    payload=payload or {},
+    key=key,
+    status='queued',
+    attempts=0,
+    max_attempts=spec.max_attempts,
+    run_at=now + timedelta(seconds=delay),
+    created_at=now)
+  if key is not None:
+    statement = statement.on_conflict_do_nothing(
+      index_elements=['key'],
+      index_where=db.text("status IN ('queued', 'running')"))
+  return statement
+
+
+def enqueue(name, payload=None, key=None, delay=0):
+  # adds the job to the current transaction, so it only runs if the caller commits
+  db.session.execute(enqueue_statement(name, payload, key=key, delay=delay))
+
+
+def prune(done_days, failed_days):
+  # deletes finished jobs older than their retention, returns how many
+  now = datetime.now()
+  deleted = db.session.execute(Job.__table__.delete().where(db.or_(
+    db.and_(Job.status == 'done', Job.finished_at < now - timedelta(days=done_days)),
+    db.and_(Job.status == 'failed', Job.finished_at < now - timedelta(days=failed_days)))))
+  db.session.commit()
+  return deleted.rowcount
+
+
+def backoff(attempts, base, limit):
+  # exponential with jitter so failing jobs don't retry in lockstep
+  return min(base * 2 ** (attempts - 1), limit) * random.uniform(0.5, 1.0)
+
+
+class Worker(object):
+  # Claimed jobs hold a lease (locked_at) that the worker renews while
+  # they run; a job whose lease runs out belonged to a worker that
+  # died. Periodic jobs are scheduled in the Job table itself: each
+  # run queues the next one, so restarts and extra workers don't add
+  # runs.
+
+  def __init__(self, app, concurrency, poll_interval):
+    self.app = app
+    self.concurrency = concurrency
+    self.poll_interval = poll_interval
+    self.stopping = threading.Event()
+    # leases are renewed, and expired ones collected, this often
+    self.housekeeping_interval = app.config["JOB_LEASE_SECONDS"] / 4.0
+
+  def stop(self):
+    self.stopping.set()
+
+  def run(self):
+    running = {}
+    next_housekeeping = 0
+    with self.app.app_context():
+      self.schedule_periodic()
+    with ThreadPoolExecutor(max_workers=self.concurrency,
+                            thread_name_prefix='job') as executor:
+      while not self.stopping.is_set():
+        with self.app.app_context():
+          running = {future: job_id for future, job_id in running.items()
+                     if not future.done()}
+          if time.monotonic() >= next_housekeeping:
+            self.renew_leases(list(running.values()))
+            self.requeue_stale()
+            self.schedule_periodic()
+            next_housekeeping = time.monotonic() + self.housekeeping_interval
+          claimed = self.claim(self.concurrency - len(running))
+        for row in claimed:
+          running[executor.submit(self.execute, row)] = row[0]
+        if not claimed:
+          self.stopping.wait(self.poll_interval)
+
+  def periodic_key(self, name):
+    return 'periodic:' + name
+
+  def schedule_periodic(self):
+    # queue a run of every periodic job that has none queued or
+    # running, which only happens on the first start
+    for spec in _registry.values():
+      if spec.every is not None:
+        enqueue(spec.name, key=self.periodic_key(spec.name))
+    db.session.commit()
+
+  def schedule_next(self, name, key):
+    # after the last attempt of a periodic run, queue the next one
+    spec = _registry.get(name)
+    if spec is None or spec.every is None or key != self.periodic_key(name):
+      return
+    every = spec.every
+    if isinstance(every, str):
+      every = self.app.config[every]
+    enqueue(name, key=key, delay=every)
+
+  def renew_leases(self, job_ids):
+    # running jobs of this worker keep their lease however long they take
+    if job_ids:
+      Job.query.filter(Job.id.in_(job_ids), Job.status == 'running').\
+        update({Job.locked_at: datetime.now()}, synchronize_session=False)
+      db.session.commit()
+
+  def requeue_stale(self):
+    # jobs whose worker died mid-run go back to the queue, or fail
+    # once they've used their attempts
+    now = datetime.now()
+    cutoff = now - timedelta(seconds=self.app.config["JOB_LEASE_SECONDS"])
+    rows = db.session.execute(db.text('''
+      UPDATE "Job" SET
+        status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+        finished_at = CASE WHEN attempts >= max_attempts THEN :now END,
+        run_at = :now,
+        last_error = 'lease expired'
+      WHERE status = 'running' AND locked_at < :cutoff
+      RETURNING name, key, status
+    '''), {"now": now, "cutoff": cutoff}).fetchall()
+    for name, key, status in rows:
+      if status == 'failed':
+        self.schedule_next(name, key)
+    db.session.commit()
+
+  def claim(self, limit):
+    if limit <= 0:
+      return []
+    rows = db.session.execute(db.text('''
+      UPDATE "Job" SET status = 'running', locked_at = :now, attempts = attempts + 1
+      WHERE id IN (
+        SELECT id FROM "Job"
+        WHERE status = 'queued' AND run_at <= :now
+        ORDER BY run_at
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED)
+      RETURNING id, name, key, payload, attempts, max_attempts
+    '''), {"now": datetime.now(), "limit": limit}).fetchall()
+    db.session.commit()
+    return rows
+
+  def execute(self, row):
+    job_id, name, key, payload, attempts, max_attempts = row
+    with self.app.app_context():
+      try:
+        spec = _registry[name]
+        spec.func(**(payload or {}))
+        db.session.commit()
+        self.finish(job_id, attempts, name, key, status='done', finished_at=datetime.now())
+      except Exception as e:
+        db.session.rollback()
+        self.app.logger.exception("job %s (%d) failed", name, job_id)
+        if attempts < max_attempts:
+          delay = backoff(attempts, self.app.config["JOB_BACKOFF_SECONDS"],
+                          self.app.config["JOB_BACKOFF_MAX_SECONDS"])
+          self.finish(job_id, attempts, name, key, status='queued', last_error=str(e),
+                      run_at=datetime.now() + timedelta(seconds=delay))
+        else:
+          self.finish(job_id, attempts, name, key, status='failed', last_error=str(e),
+                      finished_at=datetime.now())
+
+  def finish(self, job_id, attempts, name, key, **values):
+    # only while the claim is still ours: a job requeued as stale and
+    # claimed again has moved on to another attempt
+    finished = Job.query.filter(Job.id == job_id, Job.status == 'running',
+                                Job.attempts == attempts).\
+      update(values, synchronize_session=False)
+    if finished and values["status"] != 'queued':
+      self.schedule_next(name, key)
+    db.session.commit()
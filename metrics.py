@@ -0,0 +1,67 @@
+import threading
+
+#------------------------------------#
+# Process metrics in the Prometheus text format.
+#------------------------------------#
+# Counters and gauges live in the process that updates them and are
+# served by the /metrics view; with several workers each one is
+# scraped on its own, like any multi-process exporter.
+
+_lock = threading.Lock()
+_metrics = []
+
+
+class Counter(object):
+
+  kind = 'counter'
+
+  def __init__(self, name, help_text, labels=()):
+    self.name = name
+    self.help_text = help_text
+    self.labels = labels
+    self.values = {}
+    _metrics.append(self)
+
+  def inc(self, *label_values, amount=1):
+    with _lock:
+      self.values[label_values] = self.values.get(label_values, 0) + amount
+
+  def samples(self):
+    with _lock:
+      return list(self.values.items())
+
+
+class Gauge(Counter):
+  # set directly, or read from a callback when scraped
+  kind = 'gauge'
+
+  def __init__(self, name, help_text, labels=(), callback=None):
+    super(Gauge, self).__init__(name, help_text, labels)
+    self.callback = callback
+
+  def set(self, value, *label_values):
+    with _lock:
+      self.values[label_values] = value
+
+  def samples(self):
+    if self.callback is not None:
+      return list(self.callback().items())
+    return super(Gauge, self).samples()
+
+
+def _format_labels(names, values):
+  if not names:
+    return ''
+  pairs = ('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+           for name, value in zip(names, values))
+  return '{' + ','.join(pairs) + '}'
+
+def render():
+  lines = []
+  for metric in list(_metrics):
+    lines.append('# HELP %s %s' % (metric.name, metric.help_text))
+    lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+    for label_values, value in sorted(metric.samples()):
+      lines.append('%s%s %s' % (metric.name,
+                                _format_labels(metric.labels, label_values), value))
+  return '\n'.join(lines) + '\n'
@@ -0,0 +1,98 @@
+"""normalize genres into a Genre table
+
+Revision ID: 3f2a9c1d7b40
+Revises: 6ebeb8883afb
+Create Date: 2026-10-19 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7b40'
+down_revision = '6ebeb8883afb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('venue_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('artist_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('venue_genres',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'genre_id')
+    )
+    op.create_index('ix_venue_genres_genre_id', 'venue_genres', ['genre_id', 'venue_id'])
+    op.create_table('artist_genres',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id', 'genre_id')
+    )
+    op.create_index('ix_artist_genres_genre_id', 'artist_genres', ['genre_id', 'artist_id'])
+
+    # move the array values over
+    op.execute('''
+        INSERT INTO "Genre" (name)
+        SELECT DISTINCT genre FROM (
+            SELECT unnest(genres) AS genre FROM "Venue"
+            UNION
+            SELECT unnest(genres) AS genre FROM "Artist"
+        ) AS names
+        WHERE genre IS NOT NULL AND genre <> ''
+    ''')
+    op.execute('''
+        INSERT INTO venue_genres (venue_id, genre_id)
+        SELECT DISTINCT v.id, g.id
+        FROM "Venue" v, unnest(v.genres) AS u(genre)
+        JOIN "Genre" g ON g.name = u.genre
+    ''')
+    op.execute('''
+        INSERT INTO artist_genres (artist_id, genre_id)
+        SELECT DISTINCT a.id, g.id
+        FROM "Artist" a, unnest(a.genres) AS u(genre)
+        JOIN "Genre" g ON g.name = u.genre
+    ''')
+    op.execute('''
+        UPDATE "Genre" g SET
+            venue_count = (SELECT count(*) FROM venue_genres vg WHERE vg.genre_id = g.id),
+            artist_count = (SELECT count(*) FROM artist_genres ag WHERE ag.genre_id = g.id)
+    ''')
+
+    op.drop_column('Venue', 'genres')
+    op.drop_column('Artist', 'genres')
+
+
+def downgrade():
+    op.add_column('Artist', sa.Column('genres', sa.ARRAY(sa.String(length=100)), nullable=True))
+    op.add_column('Venue', sa.Column('genres', sa.ARRAY(sa.String(length=100)), nullable=True))
+
+    op.execute('''
+        UPDATE "Venue" v SET genres = (
+            SELECT array_agg(g.name ORDER BY g.name)
+            FROM venue_genres vg JOIN "Genre" g ON g.id = vg.genre_id
+            WHERE vg.venue_id = v.id)
+    ''')
+    op.execute('''
+        UPDATE "Artist" a SET genres = (
+            SELECT array_agg(g.name ORDER BY g.name)
+            FROM artist_genres ag JOIN "Genre" g ON g.id = ag.genre_id
+            WHERE ag.artist_id = a.id)
+    ''')
+
+    op.drop_index('ix_artist_genres_genre_id', table_name='artist_genres')
+    op.drop_table('artist_genres')
+    op.drop_index('ix_venue_genres_genre_id', table_name='venue_genres')
+    op.drop_table('venue_genres')
+    op.drop_table('Genre')
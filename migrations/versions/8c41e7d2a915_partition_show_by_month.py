@@ -0,0 +1,99 @@
+"""range-partition Show by start_time month
+
+Revision ID: 8c41e7d2a915
+Revises: 3f2a9c1d7b40
+Create Date: 2026-10-19 11:04:52.907166
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c41e7d2a915'
+down_revision = '3f2a9c1d7b40'
+branch_labels = None
+depends_on = None
+
+# months of partitions created past the current one and kept before
+# it (SHOW_PARTITIONS_AHEAD/RETAIN), `flask partitions` keeps this
+# window moving afterwards
+MONTHS_AHEAD = 3
+MONTHS_RETAINED = 24
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade():
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_legacy"')
+    op.execute('ALTER TABLE "Show_legacy" RENAME CONSTRAINT "Show_pkey" TO "Show_legacy_pkey"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+
+    # the partition key has to be part of the primary key
+    op.execute('''
+        CREATE TABLE "Show" (
+            id integer NOT NULL DEFAULT nextval('"Show_id_seq"'),
+            start_time timestamp without time zone NOT NULL,
+            venue_id integer NOT NULL REFERENCES "Venue" (id),
+            artist_id integer NOT NULL REFERENCES "Artist" (id),
+            PRIMARY KEY (id, start_time)
+        ) PARTITION BY RANGE (start_time)
+    ''')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+
+    # one partition per month over the retention window, widened to the
+    # oldest and newest show, so back-dated shows don't land in default
+    bind = op.get_bind()
+    oldest, newest = bind.execute(sa.text(
+        'SELECT min(start_time), max(start_time) FROM "Show_legacy"')).fetchone()
+    today = date.today()
+    month = _add_months(_month_start(today), -MONTHS_RETAINED)
+    if oldest is not None:
+        month = min(month, _month_start(oldest))
+    last = max(_add_months(_month_start(today), MONTHS_AHEAD),
+               _month_start(newest or today))
+    while month <= last:
+        op.execute(
+            'CREATE TABLE "Show_p%04d_%02d" PARTITION OF "Show" '
+            "FOR VALUES FROM ('%s') TO ('%s')"
+            % (month.year, month.month, month.isoformat(),
+               _add_months(month, 1).isoformat()))
+        month = _add_months(month, 1)
+
+    op.execute('''
+        INSERT INTO "Show" (id, start_time, venue_id, artist_id)
+        SELECT id, start_time, venue_id, artist_id FROM "Show_legacy"
+    ''')
+    op.execute('DROP TABLE "Show_legacy"')
+
+
+def downgrade():
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_partitioned"')
+    op.execute('ALTER TABLE "Show_partitioned" RENAME CONSTRAINT "Show_pkey" TO "Show_partitioned_pkey"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    op.create_table('Show',
+    sa.Column('id', sa.Integer(), server_default=sa.text('nextval(\'"Show_id_seq"\')'), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.execute('''
+        INSERT INTO "Show" (id, start_time, venue_id, artist_id)
+        SELECT id, start_time, venue_id, artist_id FROM "Show_partitioned"
+    ''')
+    # drops the attached partitions with it
+    op.execute('DROP TABLE "Show_partitioned"')
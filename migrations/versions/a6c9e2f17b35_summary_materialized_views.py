@@ -0,0 +1,63 @@
+"""materialized views for the home page and venue areas
+
+Revision ID: a6c9e2f17b35
+Revises: f3b8d61c4e27
+Create Date: 2026-10-19 18:12:12.730914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c9e2f17b35'
+down_revision = 'f3b8d61c4e27'
+branch_labels = None
+depends_on = None
+
+# how many of the newest venues and artists the home page lists,
+# summaries.RECENT_LISTINGS
+RECENT_LISTINGS = 10
+
+
+def upgrade():
+    # every view carries refreshed_at so readers can check staleness,
+    # and a unique index so it can be refreshed CONCURRENTLY
+    op.execute('''
+        CREATE MATERIALIZED VIEW area_venues AS
+        SELECT v.id AS venue_id, v.state, v.city, v.name,
+               count(s.id) AS num_upcoming_shows,
+               now()::timestamp AS refreshed_at
+        FROM "Venue" v
+        LEFT JOIN "Show" s ON s.venue_id = v.id AND s.start_time > now()::timestamp
+        WHERE v.deleted_at IS NULL
+        GROUP BY v.id
+    ''')
+    op.execute('CREATE UNIQUE INDEX uq_area_venues_venue_id ON area_venues (venue_id)')
+    op.execute('CREATE INDEX ix_area_venues_area ON area_venues (state, city, name)')
+
+    op.execute('''
+        CREATE MATERIALIZED VIEW recent_listings AS
+        (SELECT 'venue'::text AS kind, id, name, image_link, now()::timestamp AS refreshed_at
+         FROM "Venue" WHERE deleted_at IS NULL ORDER BY id DESC LIMIT %(limit)d)
+        UNION ALL
+        (SELECT 'artist'::text AS kind, id, name, image_link, now()::timestamp AS refreshed_at
+         FROM "Artist" ORDER BY id DESC LIMIT %(limit)d)
+    ''' % {"limit": RECENT_LISTINGS})
+    op.execute('CREATE UNIQUE INDEX uq_recent_listings_kind_id ON recent_listings (kind, id)')
+
+    op.execute('''
+        CREATE MATERIALIZED VIEW home_summary AS
+        SELECT 1 AS id,
+               (SELECT count(*) FROM "Venue" WHERE deleted_at IS NULL) AS venue_count,
+               (SELECT count(*) FROM "Artist") AS artist_count,
+               (SELECT count(*) FROM "Show" WHERE start_time > now()::timestamp) AS upcoming_show_count,
+               now()::timestamp AS refreshed_at
+    ''')
+    op.execute('CREATE UNIQUE INDEX uq_home_summary_id ON home_summary (id)')
+
+
+def downgrade():
+    op.execute('DROP MATERIALIZED VIEW home_summary')
+    op.execute('DROP MATERIALIZED VIEW recent_listings')
+    op.execute('DROP MATERIALIZED VIEW area_venues')
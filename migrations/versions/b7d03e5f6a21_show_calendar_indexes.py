@@ -0,0 +1,27 @@
+"""index Show by venue/artist and start_time for calendars
+
+Revision ID: b7d03e5f6a21
+Revises: 8c41e7d2a915
+Create Date: 2026-10-19 13:27:10.552318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d03e5f6a21'
+down_revision = '8c41e7d2a915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # created on the partitioned parent, Postgres builds one per partition
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'])
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'])
+
+
+def downgrade():
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
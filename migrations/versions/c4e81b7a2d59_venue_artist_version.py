@@ -0,0 +1,29 @@
+"""version counters on venues and artists for optimistic locking
+
+Revision ID: c4e81b7a2d59
+Revises: a6c9e2f17b35
+Create Date: 2026-10-19 19:02:51.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e81b7a2d59'
+down_revision = 'a6c9e2f17b35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a constant default, so existing rows don't get rewritten
+    op.add_column('Venue', sa.Column('version', sa.Integer(), nullable=False,
+                                     server_default='1'))
+    op.add_column('Artist', sa.Column('version', sa.Integer(), nullable=False,
+                                      server_default='1'))
+
+
+def downgrade():
+    op.drop_column('Artist', 'version')
+    op.drop_column('Venue', 'version')
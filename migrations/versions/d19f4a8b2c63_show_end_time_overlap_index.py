@@ -0,0 +1,40 @@
+"""add Show.end_time and GiST indexes for overlap checks
+
+Revision ID: d19f4a8b2c63
+Revises: b7d03e5f6a21
+Create Date: 2026-10-19 15:40:08.117392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd19f4a8b2c63'
+down_revision = 'b7d03e5f6a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # existing shows get the default two hour slot
+    op.execute('''UPDATE "Show" SET end_time = start_time + interval '2 hours' ''')
+    op.alter_column('Show', 'end_time', nullable=False)
+    op.create_check_constraint('ck_Show_end_after_start', 'Show', 'end_time > start_time')
+
+    # Postgres can't enforce an exclusion constraint on a table partitioned
+    # by start_time, so bookings are serialized with advisory locks and
+    # checked against these indexes (see scheduling.py)
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute('CREATE INDEX "ix_Show_venue_id_period" ON "Show" '
+               'USING gist (venue_id, tsrange(start_time, end_time))')
+    op.execute('CREATE INDEX "ix_Show_artist_id_period" ON "Show" '
+               'USING gist (artist_id, tsrange(start_time, end_time))')
+
+
+def downgrade():
+    op.drop_index('ix_Show_artist_id_period', table_name='Show')
+    op.drop_index('ix_Show_venue_id_period', table_name='Show')
+    op.drop_constraint('ck_Show_end_after_start', 'Show', type_='check')
+    op.drop_column('Show', 'end_time')
@@ -0,0 +1,41 @@
+"""cascade venue deletes to shows, track background purges
+
+Revision ID: e5a2c7f90d14
+Revises: d19f4a8b2c63
+Create Date: 2026-10-19 16:21:37.640915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a2c7f90d14'
+down_revision = 'd19f4a8b2c63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_constraint('Show_venue_id_fkey', 'Show', type_='foreignkey')
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue',
+                          ['venue_id'], ['id'], ondelete='CASCADE')
+    op.add_column('Venue', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_table('VenueDeletion',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('total_shows', sa.Integer(), nullable=False),
+    sa.Column('deleted_shows', sa.Integer(), nullable=False),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('venue_id')
+    )
+
+
+def downgrade():
+    op.drop_table('VenueDeletion')
+    op.drop_column('Venue', 'deleted_at')
+    op.drop_constraint('Show_venue_id_fkey', 'Show', type_='foreignkey')
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue',
+                          ['venue_id'], ['id'])
@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.sql.expression import ClauseElement
 
 from config import SQLALCHEMY_DATABASE_URI, SECRET_KEY, WTF_CSRF_SECRET_KEY
 
@@ -8,6 +9,60 @@ db = SQLAlchemy()
 # Models.
 #------------------------------------#
 
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer,
+              db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer,
+              db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id', 'genre_id', 'venue_id'),
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer,
+              db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer,
+              db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id', 'genre_id', 'artist_id'),
+)
+
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    # facet counts, kept up to date by the collection events below
+    venue_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    artist_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    @classmethod
+    def from_names(cls, names):
+        # resolve genre names to rows with a single IN query,
+        # creating the ones we haven't seen before
+        names = list(dict.fromkeys(name for name in names or [] if name))
+        if not names:
+            return []
+        existing = {genre.name: genre
+                    for genre in cls.query.filter(cls.name.in_(names))}
+        for name in names:
+            if name not in existing:
+                existing[name] = cls(name=name, venue_count=0, artist_count=0)
+                db.session.add(existing[name])
+        return [existing[name] for name in names]
+
+    @classmethod
+    def refresh_counts(cls):
+        # recompute every facet count from the association tables,
+        # used after bulk changes that bypass the ORM collections
+        venue_counts = db.select([db.func.count()]).\
+            where(venue_genres.c.genre_id == cls.id).scalar_subquery()
+        artist_counts = db.select([db.func.count()]).\
+            where(artist_genres.c.genre_id == cls.id).scalar_subquery()
+        cls.query.update({cls.venue_count: venue_counts,
+                          cls.artist_count: artist_counts},
+                         synchronize_session=False)
+
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
 
@@ -22,8 +77,32 @@ class Venue(db.Model):
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String)
-    genres = db.Column(db.ARRAY(db.String(100)))
-    venue = db.relationship('Show', backref=db.backref('venue_shows', lazy=True))
+    # set while a background purge removes the venue's shows
+    deleted_at = db.Column(db.DateTime)
+    # bumped by every UPDATE, which only matches the version an edit
+    # started from, see editing.py
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    genre_items = db.relationship('Genre', secondary=venue_genres,
+                                  lazy='selectin', order_by='Genre.name')
+    # shows go with the venue through ON DELETE CASCADE,
+    # never loaded into the session for it
+    venue = db.relationship('Show', backref=db.backref('venue_shows', lazy=True),
+                            passive_deletes='all')
+
+    __mapper_args__ = {'version_id_col': version}
+
+    @classmethod
+    def active(cls):
+        # filter criterion for venues that aren't being deleted
+        return cls.deleted_at.is_(None)
+
+    @property
+    def genres(self):
+        return [genre.name for genre in self.genre_items]
+
+    @genres.setter
+    def genres(self, names):
+        self.genre_items = Genre.from_names(names)
 
 
 class Artist(db.Model):
@@ -34,20 +113,140 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120), unique=True)
-    genres = db.Column(db.ARRAY(db.String(100)))
+    genre_items = db.relationship('Genre', secondary=artist_genres,
+                                  lazy='selectin', order_by='Genre.name')
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String)
     image_link = db.Column(db.String)
+    # see Venue.version
+    version = db.Column(db.Integer, nullable=False, server_default='1')
     artist = db.relationship('Show', backref=db.backref('artist_show', lazy=True))
+
+    __mapper_args__ = {'version_id_col': version}
+
+    @property
+    def genres(self):
+        return [genre.name for genre in self.genre_items]
+
+    @genres.setter
+    def genres(self, names):
+        self.genre_items = Genre.from_names(names)
     
  
 class Show(db.Model):
   __tablename__ = 'Show'
+  # monthly partitions are managed by partitions.py / `flask partitions`
+  __table_args__ = (
+    # calendar windows are index range scans on these
+    db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    db.CheckConstraint('end_time > start_time', name='ck_Show_end_after_start'),
+    {'postgresql_partition_by': 'RANGE (start_time)'},
+  )
 
-  id = db.Column(db.Integer, primary_key=True)
-  start_time = db.Column(db.DateTime, nullable=False)
-  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+  id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+  # part of the key because Postgres requires it on partitioned tables
+  start_time = db.Column(db.DateTime, primary_key=True)
+  end_time = db.Column(db.DateTime, nullable=False)
+  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
   artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+
+  @property
+  def duration(self):
+    # length of the show in minutes
+    return int((self.end_time - self.start_time).total_seconds() // 60)
+
+
+class VenueDeletion(db.Model):
+  # progress of a venue purge running in the background
+  __tablename__ = 'VenueDeletion'
+
+  venue_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+  status = db.Column(db.String(20), nullable=False, default='pending')
+  total_shows = db.Column(db.Integer, nullable=False, default=0)
+  deleted_shows = db.Column(db.Integer, nullable=False, default=0)
+  error = db.Column(db.String)
+  started_at = db.Column(db.DateTime, nullable=False)
+  finished_at = db.Column(db.DateTime)
+
+
+class Job(db.Model):
+  # background work picked up by `flask worker`, see jobs.py
+  __tablename__ = 'Job'
+  __table_args__ = (
+    db.Index('ix_Job_status_run_at', 'status', 'run_at'),
+    # at most one queued or running job per key
+    db.Index('uq_Job_pending_key', 'key', unique=True,
+             postgresql_where=db.text("status IN ('queued', 'running')")),
+  )
+
+  id = db.Column(db.Integer, primary_key=True)
+  name = db.Column(db.String(100), nullable=False)
+  payload = db.Column(db.JSON, nullable=False, default=dict)
+  key = db.Column(db.String(200))
+  status = db.Column(db.String(20), nullable=False, default='queued')
+  attempts = db.Column(db.Integer, nullable=False, default=0)
+  max_attempts = db.Column(db.Integer, nullable=False, default=5)
+  run_at = db.Column(db.DateTime, nullable=False)
+  locked_at = db.Column(db.DateTime)
+  last_error = db.Column(db.String)
+  created_at = db.Column(db.DateTime, nullable=False)
+  finished_at = db.Column(db.DateTime)
+
+
+#------------------------------------#
+# Summary views.
+#------------------------------------#
+# Materialized views kept in their own metadata so migrations and
+# create_all leave them alone, refreshed by summaries.py.
+
+summary_metadata = db.MetaData()
+
+area_venues = db.Table('area_venues', summary_metadata,
+  db.Column('venue_id', db.Integer, primary_key=True),
+  db.Column('state', db.String(120)),
+  db.Column('city', db.String(120)),
+  db.Column('name', db.String),
+  db.Column('num_upcoming_shows', db.Integer),
+  db.Column('refreshed_at', db.DateTime),
+)
+
+recent_listings = db.Table('recent_listings', summary_metadata,
+  db.Column('kind', db.String, primary_key=True),
+  db.Column('id', db.Integer, primary_key=True),
+  db.Column('name', db.String),
+  db.Column('image_link', db.String),
+  db.Column('refreshed_at', db.DateTime),
+)
+
+home_summary = db.Table('home_summary', summary_metadata,
+  db.Column('id', db.Integer, primary_key=True),
+  db.Column('venue_count', db.Integer),
+  db.Column('artist_count', db.Integer),
+  db.Column('upcoming_show_count', db.Integer),
+  db.Column('refreshed_at', db.DateTime),
+)
+
+
+#------------------------------------#
+# Genre facet counts.
+#------------------------------------#
+
+def _count_updater(count_attr, delta):
+  def update(target, genre, initiator):
+    current = getattr(genre, count_attr)
+    if current is None:
+      current = 0
+    elif db.inspect(genre).persistent and not isinstance(current, ClauseElement):
+      # increment in SQL so concurrent edits don't lose updates
+      current = getattr(Genre, count_attr)
+    setattr(genre, count_attr, current + delta)
+  return update
+
+db.event.listen(Venue.genre_items, 'append', _count_updater('venue_count', 1))
+db.event.listen(Venue.genre_items, 'remove', _count_updater('venue_count', -1))
+db.event.listen(Artist.genre_items, 'append', _count_updater('artist_count', 1))
+db.event.listen(Artist.genre_items, 'remove', _count_updater('artist_count', -1))
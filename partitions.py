@@ -0,0 +1,104 @@
+from datetime import date, datetime
+
+from models import db
+
+#------------------------------------#
+# Monthly range partitions of Show.
+#------------------------------------#
+
+PARENT_TABLE = 'Show'
+DEFAULT_PARTITION = 'Show_default'
+ARCHIVE_SCHEMA = 'archive'
+
+
+def month_start(value):
+  return date(value.year, value.month, 1)
+
+def add_months(value, months):
+  index = value.year * 12 + value.month - 1 + months
+  return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+  return '%s_p%04d_%02d' % (PARENT_TABLE, month.year, month.month)
+
+def partition_month(name):
+  # inverse of partition_name, None for the default partition
+  prefix = PARENT_TABLE + '_p'
+  if not name.startswith(prefix):
+    return None
+  try:
+    return datetime.strptime(name[len(prefix):], '%Y_%m').date()
+  except ValueError:
+    return None
+
+
+def attached_partitions(conn):
+  rows = conn.execute(db.text('''
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = :parent
+  '''), {"parent": PARENT_TABLE})
+  return [row[0] for row in rows]
+
+def create_partition(conn, month):
+  name = partition_name(month)
+  start, end = month.isoformat(), add_months(month, 1).isoformat()
+  conn.execute(db.text('CREATE TABLE "%s" (LIKE "%s" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+                       % (name, PARENT_TABLE)))
+  # shows booked past the last partition landed in the default one
+  conn.execute(db.text(
+    'WITH moved AS (DELETE FROM "%s" WHERE start_time >= :start AND start_time < :end '
+    'RETURNING *) INSERT INTO "%s" SELECT * FROM moved' % (DEFAULT_PARTITION, name)),
+    {"start": start, "end": end})
+  conn.execute(db.text(
+    'ALTER TABLE "%s" ATTACH PARTITION "%s" FOR VALUES FROM (\'%s\') TO (\'%s\')'
+    % (PARENT_TABLE, name, start, end)))
+  return name
+
+def archived_name(conn, name):
+  # name, or name_2, name_3... when the archive already holds one
+  # by that name, e.g. a month that was detached, re-created and
+  # detached again
+  candidate = name
+  suffix = 1
+  while conn.execute(db.text('SELECT to_regclass(:table)'),
+                     {"table": '%s."%s"' % (ARCHIVE_SCHEMA, candidate)}).scalar() is not None:
+    suffix += 1
+    candidate = '%s_%d' % (name, suffix)
+  return candidate
+
+def detach_partition(conn, name, archive=True):
+  conn.execute(db.text('ALTER TABLE "%s" DETACH PARTITION "%s"' % (PARENT_TABLE, name)))
+  if archive:
+    # keep the rows around, out of the way of the live table
+    conn.execute(db.text('CREATE SCHEMA IF NOT EXISTS %s' % ARCHIVE_SCHEMA))
+    target = archived_name(conn, name)
+    if target != name:
+      conn.execute(db.text('ALTER TABLE "%s" RENAME TO "%s"' % (name, target)))
+    conn.execute(db.text('ALTER TABLE "%s" SET SCHEMA %s' % (target, ARCHIVE_SCHEMA)))
+  else:
+    conn.execute(db.text('DROP TABLE "%s"' % name))
+
+
+def maintain_partitions(ahead, retain, archive=True, today=None):
+  # make sure every month from `retain` months back to `ahead` months
+  # on has a partition, moving its rows out of the default one, and
+  # detach the older ones. returns (created, detached) names.
+  current = month_start(today or date.today())
+  oldest_kept = add_months(current, -retain)
+  created = []
+  detached = []
+  with db.engine.begin() as conn:
+    existing = set(attached_partitions(conn))
+    for offset in range(-retain, ahead + 1):
+      month = add_months(current, offset)
+      if partition_name(month) not in existing:
+        created.append(create_partition(conn, month))
+    for name in sorted(existing):
+      month = partition_month(name)
+      if month is not None and month < oldest_kept:
+        detach_partition(conn, name, archive=archive)
+        detached.append(name)
+  return created, detached
@@ -0,0 +1,419 @@
+from datetime import datetime, timedelta
+from itertools import groupby
+
+import dateutil.parser
+
+from models import (db, Genre, Venue, Artist, Show, venue_genres, artist_genres,
+                    home_summary, area_venues, recent_listings)
+from jobs import enqueue_statement
+from caches import normalize_term
+from summaries import RECENT_LISTINGS
+
+#------------------------------------#
+# Read endpoints.
+#------------------------------------#
+# Every read page is a generator that yields Core statements and is
+# sent their rows back, so the same code serves the Flask views
+# through run() and the async app in asgi.py through run_async().
+
+def statement_timeout(ms):
+  # SET LOCAL, as a statement that takes parameters
+  return db.select([db.func.set_config('statement_timeout', str(ms), True)])
+
+def run(loader, timeout=None):
+  # timeout in milliseconds, set once the loader needs the database
+  try:
+    statement = next(loader)
+    if timeout:
+      db.session.execute(statement_timeout(timeout))
+    while True:
+      result = db.session.execute(statement)
+      statement = loader.send(result.fetchall() if result.returns_rows else None)
+  except StopIteration as done:
+    db.session.commit()
+    return done.value
+
+
+async def run_async(loader, session, timeout=None):
+  try:
+    statement = next(loader)
+    if timeout:
+      await session.execute(statement_timeout(timeout))
+    while True:
+      result = await session.execute(statement)
+      statement = loader.send(result.fetchall() if result.returns_rows else None)
+  except StopIteration as done:
+    await session.commit()
+    return done.value
+
+
+#  Shared pieces
+#  ----------------------------------------------------------------
+
+def upcoming_counts(column, ids=None):
+  # upcoming shows per venue_id or artist_id, as a subquery,
+  # optionally only for the ids selected by ids
+  statement = db.select([column.label('owner_id'),
+                         db.func.count(Show.id).label('num_upcoming_shows')]).\
+    where(Show.start_time > datetime.now()).group_by(column)
+  if ids is not None:
+    statement = statement.where(column.in_(ids))
+  return statement.subquery()
+
+def facets(count_column):
+  # genres that have at least one entry, for facet navigation
+  return db.select([Genre.name, count_column]).\
+    where(count_column > 0).order_by(Genre.name)
+
+def genre_ids(association, owner_column, genre):
+  # ids of the venues/artists listed under one genre
+  return db.select([owner_column]).\
+    select_from(association.join(Genre.__table__)).where(Genre.name == genre)
+
+def entity_genres(association, owner_column, entity_id):
+  return db.select([Genre.name]).\
+    select_from(association.join(Genre.__table__)).\
+    where(owner_column == entity_id).order_by(Genre.name)
+
+def fresh_summary(max_age):
+  # home_summary row while the summary views are younger than
+  # max_age seconds, otherwise None and a refresh is queued
+  rows = yield db.select([home_summary])
+  if not rows or rows[0].refreshed_at < datetime.now() - timedelta(seconds=max_age):
+    yield enqueue_statement('refresh_summaries', key='refresh_summaries')
+    return None
+  return rows[0]
+
+LISTING_MODELS = {"venue": Venue, "artist": Artist}
+
+
+def warm_names(names):
+  # every active venue and artist, loaded into the name cache
+  generation = names.generation
+  for kind, model in LISTING_MODELS.items():
+    statement = db.select([model.id, model.name, model.image_link])
+    if model is Venue:
+      statement = statement.where(Venue.active())
+    names.fill(kind, (yield statement), generation)
+
+def listings(names, kind, ids):
+  # {id: Listing} from the name cache, with one query for any misses;
+  # ids without an active row are left out
+  generation, found, missing = names.lookup(kind, ids)
+  if missing:
+    model = LISTING_MODELS[kind]
+    statement = db.select([model.id, model.name, model.image_link]).\
+      where(model.id.in_(sorted(missing)))
+    if model is Venue:
+      statement = statement.where(Venue.active())
+    found.update(names.fill(kind, (yield statement), generation, missing))
+  return found
+
+def show_tiles(names, shows, *kinds):
+  # tile dicts for rows of (venue_id|artist_id..., start_time), with
+  # the names and images of kinds filled in from the name cache.
+  # Shows of a venue that is being deleted are left out.
+  resolved = {}
+  for kind in kinds:
+    resolved[kind] = yield from listings(names, kind, {getattr(show, kind + '_id')
+                                                       for show in shows})
+  tiles = []
+  for show in shows:
+    tile = dict(show._mapping)
+    for kind in kinds:
+      listing = resolved[kind].get(tile[kind + '_id'])
+      if listing is None:
+        break
+      tile[kind + '_name'] = listing.name
+      tile[kind + '_image_link'] = listing.image_link
+    else:
+      tiles.append(tile)
+  return tiles
+
+def split_shows(tiles):
+  # (past, upcoming) from tiles ordered by start_time
+  now = datetime.now()
+  past = []
+  upcoming = []
+  for tile in tiles:
+    (upcoming if tile["start_time"] > now else past).append(tile)
+    tile["start_time"] = str(tile["start_time"])
+  return past, upcoming
+
+
+#  Pages
+#  ----------------------------------------------------------------
+
+def home_page(max_age):
+  summary = yield from fresh_summary(max_age)
+  fresh = summary is not None
+  if not fresh:
+    rows = yield db.select([
+      db.select([db.func.count(Venue.id)]).where(Venue.active()).
+        scalar_subquery().label('venue_count'),
+      db.select([db.func.count(Artist.id)]).
+        scalar_subquery().label('artist_count'),
+      db.select([db.func.count(Show.id)]).where(Show.start_time > datetime.now()).
+        scalar_subquery().label('upcoming_show_count'),
+    ])
+    summary = rows[0]
+
+  recent = {}
+  for kind, model in (('venue', Venue), ('artist', Artist)):
+    if fresh:
+      statement = db.select([recent_listings.c.id, recent_listings.c.name,
+                             recent_listings.c.image_link]).\
+        where(recent_listings.c.kind == kind).order_by(recent_listings.c.id.desc())
+    else:
+      statement = db.select([model.id, model.name, model.image_link]).\
+        order_by(model.id.desc())
+      if model is Venue:
+        statement = statement.where(Venue.active())
+    recent[kind] = yield statement.limit(RECENT_LISTINGS)
+  return {"summary": summary,
+          "recent_venues": recent['venue'],
+          "recent_artists": recent['artist']}
+
+
+def venues_page(genre, max_age):
+  summary = yield from fresh_summary(max_age)
+  genre_filter = genre_ids(venue_genres, venue_genres.c.venue_id, genre) if genre else None
+  if summary is not None:
+    statement = db.select([area_venues.c.venue_id.label('id'), area_venues.c.name,
+                           area_venues.c.city, area_venues.c.state,
+                           area_venues.c.num_upcoming_shows]).\
+      order_by(area_venues.c.state, area_venues.c.city, area_venues.c.name)
+    if genre_filter is not None:
+      statement = statement.where(area_venues.c.venue_id.in_(genre_filter))
+  else:
+    upcoming = upcoming_counts(Show.venue_id)
+    statement = db.select([Venue.id, Venue.name, Venue.city, Venue.state,
+                           db.func.coalesce(upcoming.c.num_upcoming_shows, 0).
+                             label('num_upcoming_shows')]).\
+      select_from(Venue.__table__.outerjoin(upcoming, upcoming.c.owner_id == Venue.id)).\
+      where(Venue.active()).\
+      order_by(Venue.state, Venue.city, Venue.name)
+    if genre_filter is not None:
+      statement = statement.where(Venue.id.in_(genre_filter))
+  rows = yield statement
+  facet_rows = yield facets(Genre.venue_count)
+
+  # group venues by city and state
+  areas = []
+  for (state, city), items in groupby(rows, key=lambda row: (row.state, row.city)):
+    areas.append({
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": item.id,
+        "name": item.name,
+        "num_upcoming_shows": item.num_upcoming_shows,
+      } for item in items]
+    })
+  return {"areas": areas, "genre": genre, "facets": facet_rows}
+
+
+def search_page(model, column, term, cache=None, limit=None):
+  # name search, with each match's upcoming show count from one
+  # grouped subquery instead of a COUNT per match; past limit matches
+  # the page asks for a narrower term. Results are kept per
+  # normalized term in the cache when one is given.
+  key = normalize_term(term)
+  kind = model.__tablename__
+  generation, rows = cache.get(kind, key) if cache is not None else (None, None)
+  if rows is None:
+    matches = db.select([model.id, model.name]).\
+      where(model.name.ilike('%' + key + '%')).order_by(model.name)
+    if model is Venue:
+      matches = matches.where(Venue.active())
+    if limit is not None:
+      # one extra row tells whether there were more
+      matches = matches.limit(limit + 1)
+    matches = matches.subquery()
+    upcoming = upcoming_counts(column, db.select([matches.c.id]))
+    rows = yield db.select([matches.c.id, matches.c.name,
+                            db.func.coalesce(upcoming.c.num_upcoming_shows, 0).
+                              label('num_upcoming_shows')]).\
+      select_from(matches.outerjoin(upcoming, upcoming.c.owner_id == matches.c.id)).\
+      order_by(matches.c.name)
+    rows = tuple(tuple(row) for row in rows)
+    if cache is not None:
+      cache.put(kind, key, generation, rows)
+  truncated = limit is not None and len(rows) > limit
+  if truncated:
+    rows = rows[:limit]
+  return {"results": {"count": len(rows),
+                      "truncated": truncated,
+                      "data": [{"id": id, "name": name, "num_upcoming_shows": count}
+                               for id, name, count in rows]},
+          "search_term": term}
+
+
+def venue_page(venue_id, cutoff, names):
+  rows = yield db.select([Venue.__table__]).where(Venue.id == venue_id, Venue.active())
+  if not rows:
+    return None
+  venue = rows[0]
+  genres = yield entity_genres(venue_genres, venue_genres.c.venue_id, venue_id)
+  shows = yield db.select([Show.artist_id, Show.start_time]).\
+    where(Show.venue_id == venue_id, Show.start_time >= cutoff).\
+    order_by(Show.start_time)
+  tiles = yield from show_tiles(names, shows, 'artist')
+  past_shows, upcoming_shows = split_shows(tiles)
+  return {"venue": {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": [row.name for row in genres],
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+  }}
+
+
+def artists_page(genre):
+  statement = db.select([Artist.id, Artist.name]).order_by(Artist.name)
+  if genre:
+    statement = statement.where(
+      Artist.id.in_(genre_ids(artist_genres, artist_genres.c.artist_id, genre)))
+  rows = yield statement
+  facet_rows = yield facets(Genre.artist_count)
+  return {"artists": rows, "genre": genre, "facets": facet_rows}
+
+
+def artist_page(artist_id, cutoff, names):
+  rows = yield db.select([Artist.__table__]).where(Artist.id == artist_id)
+  if not rows:
+    return None
+  artist = rows[0]
+  genres = yield entity_genres(artist_genres, artist_genres.c.artist_id, artist_id)
+  shows = yield db.select([Show.venue_id, Show.start_time]).\
+    where(Show.artist_id == artist_id, Show.start_time >= cutoff).\
+    order_by(Show.start_time)
+  tiles = yield from show_tiles(names, shows, 'venue')
+  past_shows, upcoming_shows = split_shows(tiles)
+  return {"artist": {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": [row.name for row in genres],
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+  }}
+
+
+def shows_page(cutoff, names):
+  # upcoming and recent shows, names from the name cache
+  shows = yield db.select([Show.venue_id, Show.artist_id, Show.start_time]).\
+    where(Show.start_time >= cutoff).\
+    order_by(Show.start_time)
+  tiles = yield from show_tiles(names, shows, 'venue', 'artist')
+  for tile in tiles:
+    tile["start_time"] = str(tile["start_time"])
+  return {"shows": tiles}
+
+
+#  Calendars
+#  ----------------------------------------------------------------
+#  A calendar only ever reads the shows inside the requested window,
+#  through the (venue_id|artist_id, start_time) indexes, so its cost
+#  doesn't grow with the size of a venue's or artist's history.
+
+CALENDAR_MODELS = {"venue": (Venue, Show.venue_id), "artist": (Artist, Show.artist_id)}
+
+
+def calendar_window(args, max_days):
+  # [from, to) from the query string, defaults to the coming week.
+  # raises ValueError for unparsable or oversized windows.
+  try:
+    if args.get('from'):
+      start = dateutil.parser.parse(args['from'])
+    else:
+      start = datetime.combine(datetime.now().date(), datetime.min.time())
+    if args.get('to'):
+      end = dateutil.parser.parse(args['to'])
+    else:
+      end = start + timedelta(days=7)
+  except OverflowError:
+    raise ValueError('window out of range')
+  # shows are stored in naive local time, as scheduling.parse_booking does
+  start, end = [value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+                for value in (start, end)]
+  if end <= start or end - start > timedelta(days=max_days):
+    raise ValueError('window must be positive and at most %d days' % max_days)
+  return start, end
+
+
+def calendar_filter(kind, entity_id, start, end):
+  column = CALENDAR_MODELS[kind][1]
+  return (column == entity_id, Show.start_time >= start, Show.start_time < end)
+
+
+def calendar_join():
+  return Show.__table__.\
+    join(Venue.__table__, Venue.id == Show.venue_id).\
+    join(Artist.__table__, Artist.id == Show.artist_id)
+
+
+def calendar_shows(kind, entity_id, start, end):
+  return db.select([Show.id, Show.start_time, Show.end_time,
+                    Show.venue_id, Venue.name.label('venue_name'),
+                    Show.artist_id, Artist.name.label('artist_name'),
+                    Artist.image_link.label('artist_image_link')]).\
+    select_from(calendar_join()).\
+    where(*calendar_filter(kind, entity_id, start, end)).\
+    where(Venue.active()).\
+    order_by(Show.start_time)
+
+
+def calendar_tag(kind, entity_id, start, end):
+  # (count, newest id, summed venue and artist versions) of the feed's
+  # rows: a show added or removed, or a listed venue or artist edited,
+  # changes one of them
+  return db.select([db.func.count(Show.id), db.func.max(Show.id),
+                    db.func.coalesce(db.func.sum(Venue.version + Artist.version), 0)]).\
+    select_from(calendar_join()).\
+    where(*calendar_filter(kind, entity_id, start, end)).\
+    where(Venue.active())
+
+
+def calendar_entity(kind, entity_id):
+  model = CALENDAR_MODELS[kind][0]
+  statement = db.select([model.id, model.name]).where(model.id == entity_id)
+  if model is Venue:
+    statement = statement.where(Venue.active())
+  rows = yield statement
+  return rows[0] if rows else None
+
+
+def calendar_page(kind, entity_id, start, end):
+  entity = yield from calendar_entity(kind, entity_id)
+  if entity is None:
+    return None
+  rows = yield calendar_shows(kind, entity_id, start, end)
+  shows = []
+  for row in rows:
+    show = dict(row._mapping)
+    show["show_id"] = show.pop("id")
+    show["start_time"] = str(row.start_time)
+    show["end_time"] = str(row.end_time)
+    shows.append(show)
+  return {"entity": entity, "start": start, "end": end, "shows": shows}
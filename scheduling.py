@@ -0,0 +1,184 @@
+import json
+from datetime import timedelta
+
+import dateutil.parser
+
+from models import db, Venue, Artist, Show
+
+#------------------------------------#
+# Show booking checks.
+#------------------------------------#
+
+# advisory lock namespaces, first key of pg_advisory_xact_lock(int, int)
+VENUE_LOCK = 1
+ARTIST_LOCK = 2
+
+
+def lock_bookings(venue_ids, artist_ids):
+  # serialize bookings per venue and artist until the transaction ends,
+  # taken in a fixed order so concurrent bookings can't deadlock
+  keys = sorted({(VENUE_LOCK, int(venue_id)) for venue_id in venue_ids} |
+                {(ARTIST_LOCK, int(artist_id)) for artist_id in artist_ids})
+  if not keys:
+    return
+  db.session.execute(db.text('''
+    SELECT count(pg_advisory_xact_lock(k.namespace, k.key))
+    FROM (SELECT * FROM unnest(CAST(:namespaces AS int[]), CAST(:keys AS int[]))
+          AS k(namespace, key) ORDER BY k.namespace, k.key) AS k
+  '''), {"namespaces": [namespace for namespace, key in keys],
+         "keys": [key for namespace, key in keys]})
+
+
+def find_conflict(venue_id, artist_id, start_time, end_time, max_minutes):
+  # first show overlapping [start_time, end_time) at the venue or by the
+  # artist, answered from the GiST (id, tsrange) indexes in one query
+  period = db.func.tsrange(Show.start_time, Show.end_time)
+  return Show.query.filter(
+    db.or_(Show.venue_id == venue_id, Show.artist_id == artist_id),
+    period.op('&&')(db.func.tsrange(start_time, end_time)),
+    # no show lasts longer than max_minutes, which bounds the
+    # partitions an overlapping show can live in
+    Show.start_time < end_time,
+    Show.start_time > start_time - timedelta(minutes=max_minutes),
+  ).order_by(Show.start_time).first()
+
+
+def find_conflicts(bookings, max_minutes):
+  # same check as find_conflict for a whole batch in one query,
+  # returns {index: (venue_id, artist_id, start_time, end_time)}
+  if not bookings:
+    return {}
+  rows = [{"idx": index,
+           "venue_id": booking["venue_id"],
+           "artist_id": booking["artist_id"],
+           "start_time": booking["start_time"].isoformat(),
+           "end_time": booking["end_time"].isoformat()}
+          for index, booking in bookings.items()]
+  result = db.session.execute(db.text('''
+    SELECT DISTINCT ON (r.idx) r.idx, s.venue_id, s.artist_id, s.start_time, s.end_time
+    FROM jsonb_to_recordset(CAST(:rows AS jsonb))
+      AS r(idx int, venue_id int, artist_id int, start_time timestamp, end_time timestamp)
+    JOIN "Show" s
+      ON (s.venue_id = r.venue_id OR s.artist_id = r.artist_id)
+      AND tsrange(s.start_time, s.end_time) && tsrange(r.start_time, r.end_time)
+      AND s.start_time < r.end_time
+    WHERE s.start_time > :earliest AND s.start_time < :latest
+    ORDER BY r.idx, s.start_time
+  '''), {"rows": json.dumps(rows),
+         "earliest": min(b["start_time"] for b in bookings.values()) - timedelta(minutes=max_minutes),
+         "latest": max(b["end_time"] for b in bookings.values())})
+  return {row[0]: tuple(row[1:]) for row in result}
+
+
+#------------------------------------#
+# Bulk scheduling.
+#------------------------------------#
+
+# ids are Postgres integers; anything outside would fail the whole
+# batch when it reaches the int[] casts above
+MAX_ID = 2 ** 31 - 1
+
+
+def parse_booking(raw, default_minutes, max_minutes):
+  # raw values from a form line or a JSON object,
+  # raises ValueError with a message fit for the user
+  try:
+    venue_id = int(raw.get("venue_id"))
+    artist_id = int(raw.get("artist_id"))
+  except (TypeError, ValueError):
+    raise ValueError("artist_id and venue_id must be numbers")
+  if not (0 < venue_id <= MAX_ID and 0 < artist_id <= MAX_ID):
+    raise ValueError("artist_id and venue_id must be between 1 and %d" % MAX_ID)
+  try:
+    start_time = dateutil.parser.parse(str(raw.get("start_time")))
+  except (ValueError, OverflowError):
+    raise ValueError("start_time isn't a valid date")
+  if start_time.tzinfo is not None:
+    # shows are stored in server local time, like datetime.now()
+    start_time = start_time.astimezone().replace(tzinfo=None)
+  duration = raw.get("duration")
+  if duration is None or str(duration).strip() == '':
+    # left out, an explicit 0 is still checked below
+    duration = default_minutes
+  try:
+    duration = int(duration)
+  except (TypeError, ValueError):
+    raise ValueError("duration must be a number of minutes")
+  if not 0 < duration <= max_minutes:
+    raise ValueError("duration must be between 1 and %d minutes" % max_minutes)
+  return {"venue_id": venue_id,
+          "artist_id": artist_id,
+          "start_time": start_time,
+          "end_time": start_time + timedelta(minutes=duration)}
+
+
+def _overlaps(booking, others):
+  return any(booking["start_time"] < other["end_time"] and
+             other["start_time"] < booking["end_time"] for other in others)
+
+
+def schedule_shows(raw_rows, default_minutes, max_minutes):
+  # validate and insert many shows in one transaction. invalid rows are
+  # reported and skipped, the valid ones are still created.
+  # returns one {"row", "status", "error"} dict per input row, created
+  # rows also carry the inserted values under "show".
+  results = [{"row": index + 1, "status": "error", "error": None}
+             for index in range(len(raw_rows))]
+  bookings = {}
+  for index, raw in enumerate(raw_rows):
+    try:
+      bookings[index] = parse_booking(raw, default_minutes, max_minutes)
+    except ValueError as e:
+      results[index]["error"] = str(e)
+  if not bookings:
+    return results
+
+  venue_ids = {booking["venue_id"] for booking in bookings.values()}
+  artist_ids = {booking["artist_id"] for booking in bookings.values()}
+  lock_bookings(venue_ids, artist_ids)
+  # one IN (...) per table for every referenced id
+  known_venues = {row[0] for row in
+                  db.session.query(Venue.id).filter(Venue.id.in_(venue_ids), Venue.active())}
+  known_artists = {row[0] for row in
+                   db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+  for index, booking in list(bookings.items()):
+    if booking["venue_id"] not in known_venues:
+      results[index]["error"] = "Venue id doesn't exist"
+    elif booking["artist_id"] not in known_artists:
+      results[index]["error"] = "Artist id doesn't exist"
+    else:
+      continue
+    del bookings[index]
+
+  conflicts = find_conflicts(bookings, max_minutes)
+  accepted = []
+  by_venue = {}
+  by_artist = {}
+  for index in sorted(bookings):
+    booking = bookings[index]
+    if index in conflicts:
+      venue_id, artist_id, start_time, end_time = conflicts[index]
+      booked = "Venue" if venue_id == booking["venue_id"] else "Artist"
+      results[index]["error"] = "%s is already booked from %s to %s" % (booked, start_time, end_time)
+      continue
+    # rows of the same batch can clash with each other too
+    same_venue = by_venue.setdefault(booking["venue_id"], [])
+    same_artist = by_artist.setdefault(booking["artist_id"], [])
+    if _overlaps(booking, same_venue):
+      results[index]["error"] = "Venue is booked twice in this batch"
+      continue
+    if _overlaps(booking, same_artist):
+      results[index]["error"] = "Artist is booked twice in this batch"
+      continue
+    same_venue.append(booking)
+    same_artist.append(booking)
+    accepted.append(booking)
+    results[index]["status"] = "created"
+    # naive local times, as ISO strings rather than jsonify's HTTP dates
+    results[index]["show"] = dict(booking, start_time=booking["start_time"].isoformat(),
+                                  end_time=booking["end_time"].isoformat())
+
+  if accepted:
+    # a single executemany INSERT
+    db.session.execute(Show.__table__.insert(), accepted)
+  return results
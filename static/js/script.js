@@ -2,3 +2,16 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// live updates: a [data-live-events] element is shown once the
+// /events stream it points at reports a change for this page
+document.addEventListener('DOMContentLoaded', function () {
+  var notice = document.querySelector('[data-live-events]');
+  if (!notice || !window.EventSource) return;
+  var source = new EventSource(notice.getAttribute('data-live-events'));
+  ['show_created', 'shows_created', 'venue_updated', 'artist_updated'].forEach(function (name) {
+    source.addEventListener(name, function () {
+      notice.style.display = 'block';
+    });
+  });
+});
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from models import db
+
+#------------------------------------#
+# Home page and venue area summaries.
+#------------------------------------#
+# Read pages use the materialized views while they are younger than
+# the staleness bound and fall back to the live tables otherwise,
+# see readers.fresh_summary().
+
+# newest venues and artists listed on the home page. The
+# recent_listings view is built with this many of each, changing it
+# takes a migration that recreates the view.
+RECENT_LISTINGS = 10
+
+# refreshed first, so its refreshed_at is the oldest of the three
+SUMMARY_VIEWS = ('home_summary', 'area_venues', 'recent_listings')
+
+
+def local_time_zone():
+  # this host's current UTC offset, for SET TIME ZONE
+  offset = int(datetime.now().astimezone().utcoffset().total_seconds()) // 60
+  hours, minutes = divmod(abs(offset), 60)
+  return "INTERVAL '%s%02d:%02d' HOUR TO MINUTE" % ('-' if offset < 0 else '+',
+                                                    hours, minutes)
+
+
+def refresh_summaries():
+  # the views' now()::timestamp, both refreshed_at and the upcoming
+  # cut-off, runs on this host's clock like datetime.now() in the
+  # readers and the naive show times, whatever the server's TimeZone.
+  # CONCURRENTLY keeps the views readable while they rebuild
+  for name in SUMMARY_VIEWS:
+    db.session.execute(db.text('SET LOCAL TIME ZONE %s' % local_time_zone()))
+    db.session.execute(db.text('REFRESH MATERIALIZED VIEW CONCURRENTLY %s' % name))
+    db.session.commit()
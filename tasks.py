@@ -0,0 +1,40 @@
+from flask import current_app
+
+from jobs import job, prune
+from models import Genre
+from cleanup import purge_venue
+from partitions import maintain_partitions
+from summaries import refresh_summaries
+
+#------------------------------------#
+# Job definitions.
+#------------------------------------#
+
+@job('purge_venue')
+def purge_venue_job(venue_id):
+  purge_venue(venue_id, current_app.config["VENUE_PURGE_CHUNK"])
+
+
+@job('maintain_partitions', every='PARTITION_MAINTENANCE_SECONDS')
+def maintain_partitions_job():
+  maintain_partitions(current_app.config["SHOW_PARTITIONS_AHEAD"],
+                      current_app.config["SHOW_PARTITIONS_RETAIN"])
+
+
+@job('refresh_genre_counts', every='GENRE_COUNTS_REFRESH_SECONDS')
+def refresh_genre_counts_job():
+  # the counts are kept incrementally, this corrects any drift
+  Genre.refresh_counts()
+
+
+@job('refresh_summaries', every='SUMMARY_REFRESH_SECONDS')
+def refresh_summaries_job():
+  # also rolls upcoming show counts over as shows start
+  refresh_summaries()
+
+
+@job('prune_jobs', every='JOB_PRUNE_SECONDS')
+def prune_jobs_job():
+  # done and failed jobs are kept a while for inspection, then dropped
+  prune(current_app.config["JOB_RETAIN_DONE_DAYS"],
+        current_app.config["JOB_RETAIN_FAILED_DAYS"])
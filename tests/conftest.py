@@ -0,0 +1,186 @@
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+
+import pytest
+
+#------------------------------------#
+# Query-count and plan regression harness.
+#------------------------------------#
+# The session starts a throwaway Postgres cluster (or uses the empty
+# database in TEST_DATABASE_URL), migrates it and seeds it with enough
+# rows that a query per row or a sequential scan shows up. Tests get
+# a client and a recorder of every statement the app sends.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VENUES = 300
+ARTISTS = 1000
+SHOWS = 120000
+GENRES = ('Blues', 'Folk', 'Jazz', 'Rock')
+# relations at least this big must not be read with a Seq Scan
+LARGE_TABLE_ROWS = 10000
+
+
+def _free_port():
+  with socket.socket() as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+@pytest.fixture(scope='session')
+def database_url():
+  url = os.environ.get('TEST_DATABASE_URL')
+  if url:
+    yield url
+    return
+  initdb = shutil.which('initdb')
+  if initdb is None:
+    pytest.skip('initdb not found, install Postgres or set TEST_DATABASE_URL')
+  bindir = os.path.dirname(initdb)
+  directory = tempfile.mkdtemp(prefix='fyyur-postgres-')
+  data = os.path.join(directory, 'data')
+  port = _free_port()
+  quiet = {"check": True, "stdout": subprocess.DEVNULL}
+  subprocess.run([initdb, '-D', data, '-U', 'postgres', '-A', 'trust', '--no-sync'], **quiet)
+  # unix socket only, in the temporary directory
+  subprocess.run([os.path.join(bindir, 'pg_ctl'), '-D', data, '-w',
+                  '-l', os.path.join(directory, 'postgres.log'),
+                  '-o', "-p %d -k %s -c listen_addresses='' -c fsync=off" % (port, directory),
+                  'start'], **quiet)
+  try:
+    subprocess.run([os.path.join(bindir, 'createdb'), '-h', directory, '-p', str(port),
+                    '-U', 'postgres', 'fyyur_test'], **quiet)
+    yield 'postgresql://postgres@/fyyur_test?host=%s&port=%d' % (directory, port)
+  finally:
+    subprocess.run([os.path.join(bindir, 'pg_ctl'), '-D', data, '-m', 'fast', 'stop'], **quiet)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def seed(db):
+  # a few large tables, built in SQL so seeding stays fast
+  db.session.execute(db.text(
+    'INSERT INTO "Venue" (name, city, state, address, phone, image_link) '
+    "SELECT 'Venue ' || n, 'City ' || (n % 20), 'CA', n || ' Main St', "
+    "  'v' || n, 'https://example.com/v' || n || '.png' "
+    'FROM generate_series(1, :count) AS n'), {"count": VENUES})
+  db.session.execute(db.text(
+    'INSERT INTO "Artist" (name, city, state, phone, image_link) '
+    "SELECT 'Artist ' || n, 'City ' || (n % 20), 'CA', 'a' || n, "
+    "  'https://example.com/a' || n || '.png' "
+    'FROM generate_series(1, :count) AS n'), {"count": ARTISTS})
+  db.session.execute(db.text(
+    'INSERT INTO "Genre" (name) SELECT unnest(CAST(:names AS text[]))'),
+    {"names": list(GENRES)})
+  db.session.execute(db.text(
+    'INSERT INTO venue_genres (venue_id, genre_id) '
+    'SELECT v.id, g.id FROM "Venue" v JOIN "Genre" g ON g.id % 2 = v.id % 2'))
+  db.session.execute(db.text(
+    'INSERT INTO artist_genres (artist_id, genre_id) '
+    'SELECT a.id, g.id FROM "Artist" a JOIN "Genre" g ON g.id % 3 = a.id % 3'))
+  # two-minute steps from five months ago to about two weeks on, all
+  # inside the partitions the migration creates, ~21k rows per month
+  db.session.execute(db.text(
+    'INSERT INTO "Show" (start_time, end_time, venue_id, artist_id) '
+    "SELECT start_time, start_time + interval '2 hours', 1 + n % :venues, 1 + n % :artists "
+    "FROM generate_series(1, :count) AS n, "
+    "  LATERAL (SELECT date_trunc('hour', now())::timestamp - interval '150 days' "
+    "          + n * interval '2 minutes' AS start_time) AS t"),
+    {"count": SHOWS, "venues": VENUES, "artists": ARTISTS})
+  db.session.commit()
+
+
+@pytest.fixture(scope='session')
+def app(database_url):
+  # config reads the url when app is first imported
+  os.environ['FYYUR_DATABASE_URL'] = database_url
+  from flask_migrate import upgrade
+  from app import app as flask_app
+  from models import db, Genre
+  from summaries import refresh_summaries
+  # no background warm-up requests in the middle of the counts
+  flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, WARMUP_ON_START=False)
+  with flask_app.app_context():
+    upgrade(directory=os.path.join(ROOT, 'migrations'))
+    seed(db)
+    Genre.refresh_counts()
+    db.session.commit()
+    refresh_summaries()
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+  return flask_app
+
+
+@pytest.fixture
+def client(app):
+  # every test starts with warm name lookups and no cached searches
+  import readers
+  from app import name_cache, search_cache
+  with app.app_context():
+    app.try_trigger_before_first_request_functions()
+    name_cache.clear()
+    readers.run(readers.warm_names(name_cache))
+  search_cache.invalidate()
+  return app.test_client()
+
+
+class QueryRecorder(object):
+
+  def __init__(self, engine):
+    self.engine = engine
+    self.statements = []
+
+  def record(self, conn, cursor, statement, parameters, context, executemany):
+    self.statements.append((statement, parameters, executemany))
+
+  def __len__(self):
+    return len(self.statements)
+
+  def clear(self):
+    del self.statements[:]
+
+  def report(self):
+    return '%d statements:\n\n%s' % (len(self), '\n\n'.join(
+      statement for statement, parameters, executemany in self.statements))
+
+  def seq_scans(self, min_rows=LARGE_TABLE_ROWS):
+    # (relation, statement) for each Seq Scan over a relation of at
+    # least min_rows rows in the plans of the recorded SELECTs
+    found = []
+    connection = self.engine.raw_connection()
+    try:
+      cursor = connection.cursor()
+      for statement, parameters, executemany in self.statements:
+        if executemany or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+          continue
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+        nodes = [cursor.fetchone()[0][0]['Plan']]
+        while nodes:
+          node = nodes.pop()
+          nodes.extend(node.get('Plans', ()))
+          if node['Node Type'] != 'Seq Scan':
+            continue
+          cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                         ('"%s"' % node['Relation Name'],))
+          if cursor.fetchone()[0] >= min_rows:
+            found.append((node['Relation Name'], statement))
+      connection.rollback()
+    finally:
+      connection.close()
+    return found
+
+
+@pytest.fixture
+def queries(app):
+  # statements sent through the app's engine while the test runs
+  from sqlalchemy import event
+  from models import db
+  with app.app_context():
+    engine = db.engine
+  recorder = QueryRecorder(engine)
+  event.listen(engine, 'before_cursor_execute', recorder.record)
+  try:
+    yield recorder
+  finally:
+    event.remove(engine, 'before_cursor_execute', recorder.record)
@@ -0,0 +1,27 @@
+# Calendar windows and feed revalidation.
+
+
+def test_window_with_offset_converts(client):
+  response = client.get('/venues/1/calendar?format=json'
+                        '&from=2026-10-01T00:00%2B02:00&to=2026-10-05')
+  assert response.status_code == 200
+
+
+def test_feed_etag_follows_listed_names(app, client):
+  from models import db
+  response = client.get('/venues/1/calendar.ics')
+  assert response.status_code == 200
+  etag = response.headers["ETag"]
+  assert client.get('/venues/1/calendar.ics',
+                    headers={"If-None-Match": etag}).status_code == 304
+
+  # rename an artist playing there in the window, as an edit would
+  with app.app_context():
+    db.session.execute(db.text(
+      'UPDATE "Artist" SET name = name || \' renamed\', version = version + 1 '
+      'WHERE id = (SELECT artist_id FROM "Show" WHERE venue_id = 1 '
+      '            AND start_time >= now() ORDER BY start_time LIMIT 1)'))
+    db.session.commit()
+  response = client.get('/venues/1/calendar.ics', headers={"If-None-Match": etag})
+  assert response.status_code == 200
+  assert b' renamed at ' in response.data
@@ -0,0 +1,95 @@
+import re
+
+# Edits write only what changed, guarded by the version column.
+# Artists 2 and 3 are seeded with a single genre the form accepts.
+
+
+def artist_form(app, artist_id, **changes):
+  from editing import ARTIST_EDITS, snapshot
+  from models import Artist
+  with app.app_context():
+    artist = Artist.query.get(artist_id)
+    data = {"name": artist.name,
+            "city": artist.city,
+            "state": artist.state,
+            "phone": artist.phone,
+            "genres": artist.genres,
+            "image_link": artist.image_link or '',
+            "facebook_link": artist.facebook_link or 'https://facebook.com/artist%d' % artist_id,
+            "website_link": artist.website or '',
+            "seeking_description": artist.seeking_description or '',
+            "version": artist.version,
+            "original": snapshot(artist, ARTIST_EDITS)}
+    if artist.seeking_venue:
+      data["seeking_venue"] = 'y'
+  data.update(changes)
+  return data
+
+def edit(app, client, artist_id, **changes):
+  return client.post('/artists/%d/edit' % artist_id,
+                     data=artist_form(app, artist_id, **changes))
+
+def writes(queries):
+  return [statement for statement, parameters, executemany in queries.statements
+          if statement.lstrip().startswith(('UPDATE', 'INSERT', 'DELETE'))]
+
+
+def test_unchanged_edit_writes_nothing(app, client, queries):
+  edit(app, client, 2)  # store the form's view of the empty fields
+  queries.clear()
+  response = edit(app, client, 2)
+  assert response.status_code == 302
+  assert writes(queries) == []
+
+
+def test_edit_updates_only_changed_columns(app, client, queries):
+  edit(app, client, 3)
+  queries.clear()
+  response = edit(app, client, 3, city='Elsewhere')
+  assert response.status_code == 302
+  updates = [statement for statement in writes(queries) if statement.startswith('UPDATE "Artist"')]
+  assert len(updates) == 1
+  columns = updates[0].split(' SET ')[1].split(' WHERE ')[0]
+  assert [column.split('=')[0].strip() for column in columns.split(',')] == ['city', 'version']
+
+
+def test_genres_only_edit_bumps_just_the_version(app, client, queries):
+  edit(app, client, 2)
+  queries.clear()
+  response = edit(app, client, 2, genres=['Blues'])
+  assert response.status_code == 302
+  updates = [statement for statement in writes(queries) if statement.startswith('UPDATE "Artist"')]
+  assert len(updates) == 1
+  assert updates[0].split(' SET ')[1].split(' WHERE ')[0].split('=')[0].strip() == 'version'
+
+
+def stored(app, artist_id):
+  from models import Artist
+  with app.app_context():
+    artist = Artist.query.get(artist_id)
+    return artist.city, artist.state, artist.phone
+
+
+def test_stale_edit_keeps_newer_changes(app, client):
+  edit(app, client, 3)
+  data = artist_form(app, 3, city='Merged city')
+  edit(app, client, 3, phone='555-0100')
+  response = client.post('/artists/3/edit', data=data)
+  assert response.status_code == 302
+  assert stored(app, 3)[::2] == ('Merged city', '555-0100')
+
+
+def test_overlapping_stale_edit_conflicts(app, client, queries):
+  edit(app, client, 3)
+  data = artist_form(app, 3, city='Somewhere else', phone='555-0199')
+  edit(app, client, 3, city='Theirs', state='NY')
+  queries.clear()
+  response = client.post('/artists/3/edit', data=data)
+  assert response.status_code == 409
+  assert b'You both changed: city.' in response.data
+  assert writes(queries) == []
+  # this edit's values on top of the other one's
+  assert b'value="Somewhere else"' in response.data
+  assert b'value="555-0199"' in response.data
+  assert re.search(rb'<option (selected value="NY"|value="NY" selected)', response.data)
+  assert stored(app, 3)[:2] == ('Theirs', 'NY')
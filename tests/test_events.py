@@ -0,0 +1,113 @@
+# Events reach subscribers after commit, narrowed by their filters.
+import json
+import queue
+from datetime import datetime, timedelta
+
+
+def subscribe(app, **filters):
+  from app import broadcaster
+  from models import db
+  with app.app_context():
+    broadcaster.start(db.engine)
+  assert broadcaster.listening.wait(10)
+  return broadcaster.subscribe(filters)
+
+def received(subscription):
+  messages = []
+  try:
+    while True:
+      messages.append(subscription.messages.get(timeout=2))
+  except queue.Empty:
+    return messages
+
+
+def test_show_created_reaches_filtered_subscriber(app, client):
+  from app import broadcaster
+  wanted = subscribe(app, venue_id=4)
+  other = subscribe(app, venue_id=5)
+  try:
+    start = datetime(datetime.now().year + 1, 3, 1, 20, 0)
+    response = client.post('/shows/create', data={
+      "venue_id": 4, "artist_id": 7, "duration": 60,
+      "start_time": start.strftime('%Y-%m-%d %H:%M:%S')})
+    assert response.status_code == 200
+    messages = received(wanted)
+    assert [message["event"] for message in messages] == ['show_created']
+    assert messages[0]["data"]["artist_id"] == 7
+    assert received(other) == []
+  finally:
+    broadcaster.unsubscribe(wanted)
+    broadcaster.unsubscribe(other)
+
+
+def test_bulk_shows_are_coalesced(app, client):
+  from app import app as flask_app, broadcaster
+  everything = subscribe(app)
+  wanted = subscribe(app, artist_id=9)
+  try:
+    start = datetime(datetime.now().year + 1, 6, 1, 12, 0)
+    rows = [{"venue_id": 1 + n % 300, "artist_id": 9 if n == 150 else 10 + n,
+             "start_time": (start + timedelta(hours=n)).isoformat(), "duration": 30}
+            for n in range(flask_app.config["BULK_SHOWS_MAX_ROWS"])]
+    response = client.post('/shows/bulk', json={"shows": rows})
+    assert response.get_json()["created"] == len(rows)
+    # one event per hundred shows, well inside the subscriber's buffer
+    messages = received(everything)
+    assert not everything.overflowed
+    assert [message["event"] for message in messages] == ['shows_created'] * 5
+    assert sum(message["data"]["count"] for message in messages) == len(rows)
+    messages = received(wanted)
+    assert len(messages) == 1
+    assert 9 in messages[0]["data"]["artist_ids"]
+  finally:
+    broadcaster.unsubscribe(everything)
+    broadcaster.unsubscribe(wanted)
+
+
+def open_stream(client, url):
+  response = client.get(url, buffered=False)
+  assert response.status_code == 200
+  return response, response.iter_encoded()
+
+def publish(event, **data):
+  from app import broadcaster
+  broadcaster.publish(json.dumps({"event": event, "data": data}))
+
+
+def test_stream_rejects_bad_filters(client):
+  assert client.get('/events?venue_id=four').status_code == 400
+
+
+def test_stream_sends_matching_events_and_keepalives(app, client, monkeypatch):
+  monkeypatch.setitem(app.config, "SSE_KEEPALIVE_SECONDS", 0.1)
+  response, chunks = open_stream(client, '/events?venue_id=4')
+  try:
+    assert next(chunks) == b'retry: 5000\n\n'
+    publish('venue_updated', venue_id=5)
+    publish('venue_updated', venue_id=4, name='Four')
+    assert next(chunks) == (b'event: venue_updated\n'
+                            b'data: {"venue_id": 4, "name": "Four"}\n\n')
+    assert next(chunks) == b': keep-alive\n\n'
+  finally:
+    response.close()
+
+
+def test_slow_stream_is_disconnected(app, client, monkeypatch):
+  from app import broadcaster
+  monkeypatch.setattr(broadcaster, 'buffer_size', 2)
+  before = len(broadcaster.subscriptions)
+  response, chunks = open_stream(client, '/events?artist_id=7')
+  for _ in range(3):
+    publish('artist_updated', artist_id=7, name='Seven')
+  # the stream ends instead of buffering for a client that doesn't read
+  assert list(chunks) == [b'retry: 5000\n\n']
+  response.close()
+  assert len(broadcaster.subscriptions) == before
+
+
+def test_streams_are_capped(app, client, monkeypatch):
+  from app import broadcaster
+  monkeypatch.setitem(app.config, "SSE_MAX_STREAMS", len(broadcaster.subscriptions))
+  response = client.get('/events')
+  assert response.status_code == 503
+  assert response.headers["Retry-After"]
@@ -0,0 +1,20 @@
+from datetime import datetime, timedelta
+
+
+def test_prune_keeps_recent_and_pending_jobs(app):
+  from jobs import prune
+  from models import db, Job
+  now = datetime.now()
+  old = now - timedelta(days=40)
+  with app.app_context():
+    jobs = [Job(name='prune_test', status=status, run_at=finished, created_at=finished,
+                finished_at=finished if status in ('done', 'failed') else None)
+            for status, finished in (('done', old), ('failed', old), ('done', now),
+                                     ('failed', now - timedelta(days=10)), ('queued', old))]
+    db.session.add_all(jobs)
+    db.session.commit()
+    assert prune(7, 30) >= 2
+    left = db.session.query(Job.status, Job.finished_at).filter(Job.name == 'prune_test').all()
+    db.session.query(Job).filter(Job.name == 'prune_test').delete()
+    db.session.commit()
+  assert sorted(status for status, finished_at in left) == ['done', 'failed', 'queued']
@@ -0,0 +1,76 @@
+import pytest
+
+# Upper bounds on the statements one request may send, with warm name
+# lookups and fresh summaries. A query per listed row blows through
+# them with the seeded data. Read pages count one extra statement for
+# their statement_timeout.
+
+ROUTES = [
+  ('GET', '/', None, 4),
+  ('GET', '/venues', None, 4),
+  ('GET', '/venues?genre=Jazz', None, 4),
+  ('POST', '/venues/search', {"search_term": "Venue 1"}, 2),
+  ('POST', '/venues/search', {"search_term": "e"}, 2),
+  ('GET', '/venues/1', None, 4),
+  ('GET', '/venues/1/calendar', None, 3),
+  ('GET', '/venues/1/calendar?format=json', None, 3),
+  ('GET', '/venues/1/calendar.ics', None, 5),
+  ('GET', '/artists', None, 3),
+  ('GET', '/artists?genre=Jazz', None, 3),
+  ('POST', '/artists/search', {"search_term": "Artist 1"}, 2),
+  ('POST', '/artists/search', {"search_term": "a"}, 2),
+  ('GET', '/artists/1', None, 4),
+  ('GET', '/artists/1/calendar?format=json', None, 3),
+  ('GET', '/shows', None, 2),
+]
+
+# pages that read a slice of Show and must do it through an index
+INDEXED_ROUTES = [
+  '/venues/1',
+  '/artists/1',
+  '/venues/1/calendar?format=json',
+  '/artists/1/calendar?format=json',
+]
+
+
+@pytest.mark.parametrize('method, url, data, limit', ROUTES)
+def test_query_count(client, queries, method, url, data, limit):
+  response = client.open(url, method=method, data=data)
+  assert response.status_code == 200
+  response.get_data()  # streamed bodies query as they are read
+  assert len(queries) <= limit, queries.report()
+
+
+@pytest.mark.parametrize('url', INDEXED_ROUTES)
+def test_no_seq_scans(client, queries, url):
+  assert client.get(url).status_code == 200
+  assert queries.seq_scans() == []
+
+
+def test_cached_search_skips_the_database(client, queries):
+  client.post('/venues/search', data={"search_term": "Jazz"})
+  queries.clear()
+  response = client.post('/venues/search', data={"search_term": "  JAZZ "})
+  assert response.status_code == 200
+  assert len(queries) == 0, queries.report()
+
+
+def test_show_tiles_use_the_name_cache(client, queries):
+  from app import name_cache
+  name_cache.clear()
+  client.get('/shows')
+  cold = len(queries)
+  queries.clear()
+  client.get('/shows')
+  # one IN query per kind while cold, none once cached
+  assert len(queries) == cold - 2, queries.report()
+
+
+def test_missing_listings_are_cached(app, client, queries):
+  import readers
+  from app import name_cache
+  with app.app_context():
+    assert readers.run(readers.listings(name_cache, 'venue', {1, 999999})).keys() == {1}
+    queries.clear()
+    assert readers.run(readers.listings(name_cache, 'venue', {1, 999999})).keys() == {1}
+  assert len(queries) == 0, queries.report()
@@ -0,0 +1,17 @@
+# Show scheduling through the form and the bulk endpoint.
+
+
+def test_out_of_range_ids_are_field_errors(client):
+  response = client.post('/shows/create', data={
+    "venue_id": 2 ** 31, "artist_id": 1, "duration": 60,
+    "start_time": '2030-01-01 20:00:00'})
+  assert response.status_code == 200
+  assert b'An error occurred' not in response.data
+  assert b'Number must be between 1 and 2147483647' in response.data
+
+
+def test_bulk_results_carry_iso_times(client):
+  response = client.post('/shows/bulk', json={"shows": [
+    {"venue_id": 11, "artist_id": 21, "start_time": '2031-02-03T19:30', "duration": 90}]})
+  show = response.get_json()["rows"][0]["show"]
+  assert (show["start_time"], show["end_time"]) == ('2031-02-03T19:30:00', '2031-02-03T21:00:00')
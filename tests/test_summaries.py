@@ -0,0 +1,14 @@
+from datetime import datetime, timedelta
+
+
+def test_refresh_uses_the_app_clock(app):
+  # a server TimeZone far from this host's must not age the views;
+  # home_summary is refreshed first, in the transaction set up here
+  from models import db
+  from summaries import refresh_summaries
+  with app.app_context():
+    db.session.execute(db.text("SET LOCAL TIME ZONE 'Pacific/Kiritimati'"))
+    refresh_summaries()
+    refreshed_at = db.session.execute(db.text('SELECT refreshed_at FROM home_summary')).scalar()
+    db.session.commit()
+  assert abs(refreshed_at - datetime.now()) < timedelta(minutes=1)
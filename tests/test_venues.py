@@ -0,0 +1,27 @@
+# Deleting venues: small ones at once, big ones in the background.
+
+
+def test_big_venue_is_hidden_without_counting_its_history(app, client, queries):
+  from models import db, Genre, Venue
+  limit = app.config["VENUE_DELETE_INLINE_SHOWS"]
+  with app.app_context():
+    venue = Venue(name='Doomed hall', city='City 1', state='CA', genres=['Blues'])
+    db.session.add(venue)
+    db.session.flush()
+    venue_id = venue.id
+    db.session.execute(db.text(
+      'INSERT INTO "Show" (start_time, end_time, venue_id, artist_id) '
+      "SELECT now()::timestamp + n * interval '3 hours', "
+      "  now()::timestamp + n * interval '3 hours' + interval '1 hour', :venue_id, 1 "
+      'FROM generate_series(1, :count) AS n'), {"venue_id": venue_id, "count": limit + 5})
+    db.session.commit()
+    blues = Genre.query.filter_by(name='Blues').one().venue_count
+
+  queries.clear()
+  response = client.delete('/venues/%d' % venue_id)
+  assert response.status_code == 202
+  counts = [statement for statement, parameters, executemany in queries.statements
+            if 'count(' in statement and '"Show"' in statement]
+  assert counts and all('LIMIT' in statement for statement in counts), queries.report()
+  with app.app_context():
+    assert Genre.query.filter_by(name='Blues').one().venue_count == blues - 1
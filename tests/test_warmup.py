@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def warm_up(client):
+  from app import warm_up
+  yield warm_up
+  # back to how a fresh process starts
+  warm_up.state = 'cold'
+  warm_up.steps = {}
+  warm_up.failures = 0
+  warm_up.retry_at = 0
+
+
+def test_ready_only_after_warmup(client, warm_up):
+  response = client.get('/healthz/ready')
+  assert response.status_code == 503
+  assert response.headers["Retry-After"]
+
+  warm_up.run()
+  response = client.get('/healthz/ready')
+  assert response.status_code == 200
+  body = response.get_json()
+  assert body["status"] == 'ready'
+  assert set(body["steps"]) == {'connections', 'templates', 'names', 'pages'}
+
+
+def test_failed_warmup_is_retried(client, warm_up, monkeypatch):
+  def broken():
+    raise RuntimeError('templates unavailable')
+  monkeypatch.setattr(warm_up, 'compile_templates', broken)
+  with pytest.raises(RuntimeError):
+    warm_up.run()
+  # the probe doesn't restart it before the backoff has passed
+  response = client.get('/healthz/ready')
+  assert response.status_code == 503
+  assert response.get_json()["status"] == 'failed'
+
+  monkeypatch.undo()
+  warm_up.retry_at = 0
+  client.get('/healthz/ready')
+  deadline = time.monotonic() + 60
+  while warm_up.state == 'warming' and time.monotonic() < deadline:
+    time.sleep(0.1)
+  response = client.get('/healthz/ready')
+  assert response.status_code == 200
+  assert warm_up.failures == 0
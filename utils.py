@@ -9,4 +9,28 @@ def format_datetime(value, format='medium'):
       format="EEEE MMMM, d, y 'at' h:mma"
   elif format == 'medium':
       format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
\ No newline at end of file
+  return babel.dates.format_datetime(date, format, locale='en')
+
+
+# iCalendar (RFC 5545) helpers
+def ics_escape(value):
+  return (str(value).replace('\\', '\\\\').replace(';', '\\;')
+          .replace(',', '\\,').replace('\n', '\\n'))
+
+def ics_datetime(value):
+  # floating local time, shows are stored without a time zone
+  return value.strftime('%Y%m%dT%H%M%S')
+
+def ics_line(name, value):
+  # content lines are folded at 75 octets
+  line = (name + ':' + value).encode('utf-8')
+  chunks = []
+  while len(line) > 75:
+    cut = 75 if not chunks else 74
+    # never split a multi-byte character
+    while cut and (line[cut] & 0xC0) == 0x80:
+      cut -= 1
+    chunks.append(line[:cut])
+    line = line[cut:]
+  chunks.append(line)
+  return b'\r\n '.join(chunks).decode('utf-8') + '\r\n'
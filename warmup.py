@@ -0,0 +1,131 @@
+import threading
+import time
+from datetime import datetime
+
+from models import db, Show
+import readers
+
+#------------------------------------#
+# Warm-up of a fresh app process.
+#------------------------------------#
+# Before a new process takes traffic it opens its pool connections,
+# compiles every template, loads the name cache and renders the key
+# pages and the busiest venues and artists once, which also pulls
+# their rows and indexes into Postgres' buffers. /healthz/ready
+# reports ready once this has run, and starts a failed warm-up again
+# with a doubling backoff.
+
+
+class Warmup(object):
+
+  def __init__(self, app, names, top, retry_seconds=5, retry_max_seconds=300):
+    self.app = app
+    self.names = names
+    self.top = top
+    self.retry_seconds = retry_seconds
+    self.retry_max_seconds = retry_max_seconds
+    self.state = 'cold'
+    # seconds per finished step
+    self.steps = {}
+    self.failures = 0
+    # monotonic time a failed warm-up may start again
+    self.retry_at = 0
+    # steps run elsewhere, e.g. asgi.py's, that readiness waits for too
+    self.pending = set()
+    self.lock = threading.Lock()
+
+  @property
+  def ready(self):
+    return self.state == 'ready' and not self.pending
+
+  @property
+  def status(self):
+    return 'warming' if self.state == 'ready' and self.pending else self.state
+
+  def expect(self, name):
+    self.pending.add(name)
+
+  def finished(self, name, seconds):
+    self.steps[name] = round(seconds, 3)
+    self.pending.discard(name)
+
+  def start(self):
+    # in the background, once per process or again after a failure
+    with self.lock:
+      if self.state == 'failed' and time.monotonic() >= self.retry_at:
+        pass
+      elif self.state != 'cold':
+        return
+      self.state = 'warming'
+    threading.Thread(target=self.run, kwargs={"reraise": False},
+                     name='warmup', daemon=True).start()
+
+  def run(self, echo=None, reraise=True):
+    self.state = 'warming'
+    steps = (('connections', self.open_connections),
+             ('templates', self.compile_templates),
+             ('names', self.load_names),
+             ('pages', self.render_pages))
+    for name, step in steps:
+      self.steps.pop(name, None)
+    try:
+      for name, step in steps:
+        started = time.monotonic()
+        detail = step()
+        self.steps[name] = round(time.monotonic() - started, 3)
+        if echo is not None:
+          echo('%s: %s in %.2fs' % (name, detail, self.steps[name]))
+    except Exception:
+      delay = min(self.retry_seconds * 2 ** self.failures, self.retry_max_seconds)
+      self.failures += 1
+      self.retry_at = time.monotonic() + delay
+      self.state = 'failed'
+      self.app.logger.exception('warm-up failed, retrying in %ds', delay)
+      if reraise:
+        raise
+      return
+    self.failures = 0
+    self.state = 'ready'
+
+  def open_connections(self):
+    # every pooled connection at once, so none is opened on a request
+    with self.app.app_context():
+      engine = db.engine
+    size = engine.pool.size() if hasattr(engine.pool, 'size') else 1
+    connections = [engine.connect() for _ in range(size)]
+    for connection in connections:
+      connection.execute(db.select([1]))
+      connection.close()
+    return '%d opened' % size
+
+  def compile_templates(self):
+    names = [name for name in self.app.jinja_env.list_templates()
+             if name.endswith('.html')]
+    for name in names:
+      self.app.jinja_env.get_template(name)
+    return '%d compiled' % len(names)
+
+  def load_names(self):
+    with self.app.app_context():
+      readers.run(readers.warm_names(self.names))
+    return '%d venues, %d artists' % (len(self.names.records["venue"]),
+                                      len(self.names.records["artist"]))
+
+  def busiest(self, column):
+    # ids with the most upcoming shows
+    return [row[0] for row in db.session.execute(
+      db.select([column]).where(Show.start_time > datetime.now()).
+      group_by(column).order_by(db.func.count().desc()).limit(self.top))]
+
+  def render_pages(self):
+    with self.app.app_context():
+      urls = ['/', '/venues', '/artists', '/shows']
+      urls += ['/venues/%d' % id for id in self.busiest(Show.venue_id)]
+      urls += ['/artists/%d' % id for id in self.busiest(Show.artist_id)]
+      db.session.remove()
+    client = self.app.test_client()
+    for url in urls:
+      response = client.get(url)
+      if response.status_code >= 500:
+        raise RuntimeError('%s answered %d' % (url, response.status_code))
+    return '%d rendered' % len(urls)